@@ -1,38 +1,62 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, abort, jsonify
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_migrate import Migrate
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-import pandas as pd
-from io import BytesIO
-from forms import ProspectionForm, LoginForm, DownloadExcelForm, NovaPharmaSalesForm, GilbertSalesForm, EricFavreSalesForm, TroisCheneSalesForm
+from werkzeug.security import check_password_hash
+from forms import ProspectionForm, LoginForm
 from flask_wtf.csrf import CSRFProtect
-from flask_caching import Cache
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from sqlalchemy import func
+import click
 import logging
 from models import Planning
 from forms import PlanningForm
-from models import db, User, Prospection, NovaPharmaProduct, GilbertProduct, EricFavreProduct, TroisCheneProduct, NovaPharmaSale, GilbertSale, EricFavreSale, TroisCheneSale
+from models import db, User, Prospection, ExportJob, Product
+from revenue import DASHBOARD_LABS, LABS, MONTHLY_REVENUE_LABS, NASDERM_LABS, NASMEDIC_LABS, monthly_revenue_series, monthly_revenue_table, product_revenue, rebuild_revenue_rollup, revenue_last_modified
+from sales import SalesFormError, save_sales_entry
+from stock import compact_stock_ledger, current_stock, movement_totals, stock_at
+from periods import month_range, period_range
+from exports import filtered_export_query, write_roster_xlsx, write_xlsx
+from auth import configure_user_cache, load_session_user
+from caching import cache_stats, configure_cache
+from logconfig import configure_logging
+from assets import configure_assets
+from metrics import configure_metrics
+from database import configure_database, configure_sqlite_pragmas
+from seed import seed
+import bench
+from querystats import configure_query_stats, query_stats_report
+from facets import prospection_facets
+from conditional import closed_month_max_age, conditional_json, conditional_page, table_version
+from jobs import job_status, submit_export
+from projections import commercial_by_id, commercial_by_username, commercial_options, commercial_prospection_rows, planning_rows
+from plannings import PLANNING_HALF_DAYS, PLANNING_SLOTS, planning_coverage, save_planning
+from roster import roster_weeks, weekly_rosters
+from listings import PAGE_SIZE, filtered_prospections, paginate_prospections, prospection_filters, serialize_prospection, top_commerciaux
+from datetime import date, timedelta
 import os
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'une_clé_secrète_très_complexe')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///plateforme_commerciale.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['DEBUG'] = False
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Journalisation JSON via une file, niveaux configurables (voir logconfig.py)
+configure_logging(app)
 logger = logging.getLogger(__name__)
 
+# Compression et ressources statiques versionnées ; enregistré en premier, le hook de
+# compression s'exécute après tous les autres after_request
+configure_assets(app)
+
 csrf = CSRFProtect(app)
-cache = Cache(app)
+configure_cache(app)
+configure_query_stats(app)
+configure_user_cache(app)
 
-# Initialiser SQLAlchemy avec l'application Flask
+# Initialiser SQLAlchemy avec l'application Flask (URI et options lues dans l'environnement)
+configure_database(app)
 db.init_app(app)
+with app.app_context():
+    configure_sqlite_pragmas(app, db.engine)
+configure_metrics(app)
 
 migrate = Migrate(app, db)
 
@@ -42,7 +66,8 @@ login_manager.login_view = 'login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Champs de session en cache : pas de requête SQL pour les utilisateurs récents
+    return load_session_user(user_id)
 
 @app.route('/')
 def home():
@@ -101,7 +126,7 @@ def visualiser_planning():
         return redirect(url_for('accueil'))
 
     # Récupérer les plannings du commercial connecté
-    plannings = Planning.query.filter_by(commercial_id=current_user.id).all()
+    plannings = planning_rows(current_user.id)
     return render_template('visualiser_planning.html', plannings=plannings)
 
 @app.route('/saisie_planning', methods=['GET', 'POST'])
@@ -112,24 +137,9 @@ def saisie_planning():
 
     formulaire = PlanningForm()
     if formulaire.validate_on_submit():
-        nouveau_planning = Planning(
-            commercial_id=current_user.id,
-            date=formulaire.date.data,
-            lundi_matin=", ".join(request.form.getlist('lundi_matin')),
-            lundi_soir=", ".join(request.form.getlist('lundi_soir')),
-            mardi_matin=", ".join(request.form.getlist('mardi_matin')),
-            mardi_soir=", ".join(request.form.getlist('mardi_soir')),
-            mercredi_matin=", ".join(request.form.getlist('mercredi_matin')),
-            mercredi_soir=", ".join(request.form.getlist('mercredi_soir')),
-            jeudi_matin=", ".join(request.form.getlist('jeudi_matin')),
-            jeudi_soir=", ".join(request.form.getlist('jeudi_soir')),
-            vendredi_matin=", ".join(request.form.getlist('vendredi_matin')),
-            vendredi_soir=", ".join(request.form.getlist('vendredi_soir')),
-            samedi_matin=", ".join(request.form.getlist('samedi_matin')),
-            samedi_soir=", ".join(request.form.getlist('samedi_soir')),
-        )
-        db.session.add(nouveau_planning)
-        db.session.commit()
+        # Colonnes texte et demi-journées normalisées (planning_slot), dans la même transaction
+        save_planning(current_user.id, formulaire.date.data,
+                      {slot: request.form.getlist(slot) for slot in PLANNING_SLOTS})
         return redirect(url_for('visualiser_planning'))
 
     return render_template('saisie_planning.html', formulaire=formulaire)
@@ -137,100 +147,44 @@ def saisie_planning():
 @app.route('/nasmedic_dashboard')
 @login_required
 def nasmedic_dashboard():
-    # Récupérer les prospections pour NASMEDIC
-    prospections = Prospection.query.join(User).filter(User.project == 'nasmedic').all()
-    
-    # Afficher les données dans la console pour débogage
-    print("Prospections pour NASMEDIC:", prospections)
+    # Récupérer une page de prospections pour NASMEDIC, filtrée côté serveur
+    filters = prospection_filters(request.args)
+    page = paginate_prospections(filtered_prospections(filters, project='nasmedic'), request.args.get('cursor'))
+    prospections = page.items
     
     # Vérifier si des données sont retournées
     if not prospections:
         flash("Aucune donnée trouvée pour NASMEDIC.", "info")
     
-    # Récupérer le chiffre d'affaire mensuel pour NASMEDIC
-    monthly_revenue = db.session.query(
-        func.strftime('%Y-%m', EricFavreSale.date).label('month'),
-        func.sum(EricFavreSale.quantity * EricFavreSale.price).label('revenue')
-    ).filter(EricFavreSale.project == 'nasmedic').group_by('month').all()
-
-    # Préparer les données pour le graphique
-    monthly_revenue_labels = [row.month for row in monthly_revenue]
-    monthly_revenue_data = [row.revenue for row in monthly_revenue]
-
-    # Afficher les données dans la console pour débogage
-    print("Chiffre d'affaire mensuel:", monthly_revenue)
-    print("Labels:", monthly_revenue_labels)
-    print("Data:", monthly_revenue_data)
-    
-    # Récupérer les prospections pour NASMEDIC
-    prospections = Prospection.query.join(User).filter(User.project == 'nasmedic').all()
-
-    # Récupérer le classement des commerciaux (Top 5)
-    top_5_commerciaux = db.session.query(
-        User.username,
-        User.zone,
-        func.count(Prospection.id).label('nombre_visites')
-    ).join(Prospection).filter(User.project == 'nasmedic').group_by(User.id).order_by(func.count(Prospection.id).desc()).limit(5).all()
-
-    # Afficher les données dans la console pour débogage
-    print("Top 5 commerciaux:", top_5_commerciaux)
+    # Chiffre d'affaire mensuel et Top 5 : chargés par la page via /api/charts
     
     # Récupérer la liste des commerciaux pour NASMEDIC
-    commerciaux = User.query.filter_by(project='nasmedic', role='commercial').all()
+    commerciaux = commercial_options('nasmedic')
 
-    # Afficher les données dans la console pour débogage
-    print("Liste des commerciaux NASMEDIC:", commerciaux)
+    logger.debug("nasmedic_dashboard : %d prospections, %d commerciaux", len(prospections), len(commerciaux))
 
-    return render_template('nasmedic_dashboard.html', monthly_revenue_labels=monthly_revenue_labels, monthly_revenue_data=monthly_revenue_data, top_5_commerciaux=top_5_commerciaux, commerciaux=commerciaux, prospections=prospections)
+    return render_template('nasmedic_dashboard.html', commerciaux=commerciaux, prospections=prospections, next_cursor=page.next_cursor, filters=filters, facets=prospection_facets('nasmedic'))
     
 @app.route('/nasderm_dashboard')
 @login_required
 def nasderm_dashboard():
-    # Récupérer les prospections pour NASDERM
-    prospections = Prospection.query.join(User).filter(User.project == 'nasderm').all()
-    
-    # Afficher les données dans la console pour débogage
-    print("Prospections pour NASDERM:", prospections)
+    # Récupérer une page de prospections pour NASDERM, filtrée côté serveur
+    filters = prospection_filters(request.args)
+    page = paginate_prospections(filtered_prospections(filters, project='nasderm'), request.args.get('cursor'))
+    prospections = page.items
     
     # Vérifier si des données sont retournées
     if not prospections:
         flash("Aucune donnée trouvée pour NASDERM.", "info")
     
-    # Récupérer le chiffre d'affaire mensuel pour NASDERM
-    monthly_revenue = db.session.query(
-        func.strftime('%Y-%m', NovaPharmaSale.date).label('month'),
-        func.sum(NovaPharmaSale.quantity * NovaPharmaSale.price).label('revenue')
-    ).filter(NovaPharmaSale.project == 'nasderm').group_by('month').all()
-
-    # Préparer les données pour le graphique
-    monthly_revenue_labels = [row.month for row in monthly_revenue]
-    monthly_revenue_data = [row.revenue for row in monthly_revenue]
-
-    # Afficher les données dans la console pour débogage
-    print("Chiffre d'affaire mensuel NASDERM:", monthly_revenue)
-    print("Labels:", monthly_revenue_labels)
-    print("Data:", monthly_revenue_data)
-    
-    # Récupérer les prospections pour NASDERM
-    prospections = Prospection.query.join(User).filter(User.project == 'nasderm').all()
-
-    # Récupérer le classement des commerciaux (Top 5)
-    top_5_commerciaux = db.session.query(
-        User.username,
-        User.zone,
-        func.count(Prospection.id).label('nombre_visites')
-    ).join(Prospection).filter(User.project == 'nasderm').group_by(User.id).order_by(func.count(Prospection.id).desc()).limit(5).all()
-
-    # Afficher les données dans la console pour débogage
-    print("Top 5 commerciaux:", top_5_commerciaux)
+    # Chiffre d'affaire mensuel et Top 5 : chargés par la page via /api/charts
     
     # Récupérer la liste des commerciaux pour NASDERM
-    commerciaux = User.query.filter_by(project='nasderm', role='commercial').all()
+    commerciaux = commercial_options('nasderm')
 
-    # Afficher les données dans la console pour débogage
-    print("Liste des commerciaux NASDERM:", commerciaux)
+    logger.debug("nasderm_dashboard : %d prospections, %d commerciaux", len(prospections), len(commerciaux))
 
-    return render_template('nasderm_dashboard.html', monthly_revenue_labels=monthly_revenue_labels, monthly_revenue_data=monthly_revenue_data, top_5_commerciaux=top_5_commerciaux, commerciaux=commerciaux, prospections=prospections)
+    return render_template('nasderm_dashboard.html', commerciaux=commerciaux, prospections=prospections, next_cursor=page.next_cursor, filters=filters, facets=prospection_facets('nasderm'))
    
     
 @app.route('/admin_dashboard', methods=['GET', 'POST'])
@@ -240,86 +194,52 @@ def admin_dashboard():
         flash('Accès non autorisé.', 'error')
         return redirect(url_for('home'))
     
-    # Calcul du chiffre d'affaire mensuel pour Nova Pharma
-    nova_pharma_revenue = db.session.query(
-        func.strftime('%Y-%m', NovaPharmaSale.date).label('month'),
-        func.sum(NovaPharmaSale.quantity * NovaPharmaSale.price).label('revenue')
-    ).group_by('month').all()
-    
-    # Calcul du chiffre d'affaire mensuel pour Gilbert
-    gilbert_revenue = db.session.query(
-        func.strftime('%Y-%m', GilbertSale.date).label('month'),
-        func.sum(GilbertSale.quantity * GilbertSale.price).label('revenue')
-    ).group_by('month').all()
-    
-    # Calcul du chiffre d'affaire mensuel pour Eric Favre
-    eric_favre_revenue = db.session.query(
-        func.strftime('%Y-%m', EricFavreSale.date).label('month'),
-        func.sum(EricFavreSale.quantity * EricFavreSale.price).label('revenue')
-    ).group_by('month').all()
-    
-    # Calcul du chiffre d'affaire mensuel pour 3 Chênes Pharma
-    trois_chene_revenue = db.session.query(
-        func.strftime('%Y-%m', TroisCheneSale.date).label('month'),
-        func.sum(TroisCheneSale.quantity * TroisCheneSale.price).label('revenue')
-    ).group_by('month').all()
-    
-    # Combiner les résultats dans un dictionnaire
-    revenue_dict = {}
-    for month, revenue in nova_pharma_revenue:
-        revenue_dict[month] = {'nova_pharma_revenue': revenue or 0, 'gilbert_revenue': 0, 'eric_favre_revenue': 0, 'trois_chene_revenue': 0}
-    
-    for month, revenue in gilbert_revenue:
-        if month in revenue_dict:
-            revenue_dict[month]['gilbert_revenue'] = revenue or 0
-        else:
-            revenue_dict[month] = {'nova_pharma_revenue': 0, 'gilbert_revenue': revenue or 0, 'eric_favre_revenue': 0, 'trois_chene_revenue': 0}
-    
-    for month, revenue in eric_favre_revenue:
-        if month in revenue_dict:
-            revenue_dict[month]['eric_favre_revenue'] = revenue or 0
-        else:
-            revenue_dict[month] = {'nova_pharma_revenue': 0, 'gilbert_revenue': 0, 'eric_favre_revenue': revenue or 0, 'trois_chene_revenue': 0}
-    
-    for month, revenue in trois_chene_revenue:
-        if month in revenue_dict:
-            revenue_dict[month]['trois_chene_revenue'] = revenue or 0
-        else:
-            revenue_dict[month] = {'nova_pharma_revenue': 0, 'gilbert_revenue': 0, 'eric_favre_revenue': 0, 'trois_chene_revenue': revenue or 0}
-    
-    # Convertir le dictionnaire en une liste pour le template
-    monthly_revenue = []
-    for month, revenues in revenue_dict.items():
-        total = revenues['nova_pharma_revenue'] + revenues['gilbert_revenue'] + revenues['eric_favre_revenue'] + revenues['trois_chene_revenue']
-        monthly_revenue.append((month, revenues['nova_pharma_revenue'], revenues['gilbert_revenue'], revenues['eric_favre_revenue'], revenues['trois_chene_revenue'], total))
-    
-    # Extraire les labels et les données pour le graphique
-    monthly_revenue_labels = [row[0] for row in monthly_revenue]
-    monthly_revenue_data = [row[5] for row in monthly_revenue]
+    # Chiffre d'affaire mensuel et Top 5 : chargés par la page via /api/charts.
+    # La page ne reprend que les filtres, transmis à l'export Excel : aucune requête ici
+    filters = prospection_filters(request.args)
 
-    commerciaux = User.query.filter_by(role='commercial').all()
-    top_5_commerciaux = db.session.query(User.username, User.zone, func.count(Prospection.id).label('nombre_visites')).join(Prospection).group_by(User.id).order_by(func.count(Prospection.id).desc()).limit(5).all()
-    
-    # Filtres pour le tableau récapitulatif
-    date_start = request.args.get('date_start')
-    date_end = request.args.get('date_end')
-    commercial_id = request.args.get('commercial')
-    zone = request.args.get('zone')
-    specialite = request.args.get('specialite')
-    query = Prospection.query.join(User).filter(User.role == 'commercial')
-    if date_start:
-        query = query.filter(Prospection.date >= date_start)
-    if date_end:
-        query = query.filter(Prospection.date <= date_end)
-    if commercial_id:
-        query = query.filter(Prospection.commercial_id == commercial_id)
-    if zone:
-        query = query.filter(User.zone == zone)
-    if specialite:
-        query = query.filter(Prospection.specialite == specialite)
-    prospections = query.all()
-    
-    return render_template('admin_dashboard.html', commerciaux=commerciaux, prospections=prospections, top_5_commerciaux=top_5_commerciaux, monthly_revenue_labels=monthly_revenue_labels, monthly_revenue_data=monthly_revenue_data)
+    return render_template('admin_dashboard.html', filters=filters)
+
+@app.route('/api/prospections')
+@login_required
+def api_prospections():
+    if current_user.role not in ['admin', 'commercial']:
+        abort(403)
+
+    # Un commercial ne voit que les prospections de son projet
+    project = request.args.get('project') if current_user.role == 'admin' else current_user.project
+    filters = prospection_filters(request.args)
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    page = paginate_prospections(filtered_prospections(filters, project=project), request.args.get('cursor'), limit)
+    return jsonify(items=[serialize_prospection(p) for p in page.items], next_cursor=page.next_cursor)
+
+@app.route('/api/charts/monthly_revenue/<scope>')
+@login_required
+def api_chart_monthly_revenue(scope):
+    if current_user.role not in ['admin', 'commercial']:
+        abort(403)
+    if scope not in DASHBOARD_LABS:
+        abort(404)
+
+    def build():
+        labels, data = monthly_revenue_series(DASHBOARD_LABS[scope])
+        return {'labels': labels, 'data': data}
+    # 304 si le cumul des laboratoires n'a pas été réécrit depuis la dernière lecture du client
+    return conditional_json(revenue_last_modified(DASHBOARD_LABS[scope]), build, scope)
+
+@app.route('/api/charts/top_commerciaux/<scope>')
+@login_required
+def api_chart_top_commerciaux(scope):
+    if current_user.role not in ['admin', 'commercial']:
+        abort(403)
+    if scope not in DASHBOARD_LABS:
+        abort(404)
+
+    def build():
+        rows = top_commerciaux(None if scope == 'all' else scope)
+        return {'items': [{'username': username, 'zone': zone, 'nombre_visites': visites}
+                          for username, zone, visites in rows]}
+    return conditional_json(table_version(['prospection', 'user']), build, scope)
 
 # app.py
 @app.route('/admin_plannings')
@@ -330,7 +250,7 @@ def admin_plannings():
         return redirect(url_for('home'))
     
     # Récupérer tous les commerciaux
-    commerciaux = User.query.filter_by(role='commercial').all()
+    commerciaux = commercial_options()
     return render_template('admin_plannings.html', commerciaux=commerciaux)
 
 @app.route('/admin_planning_detail/<int:commercial_id>')
@@ -341,72 +261,208 @@ def admin_planning_detail(commercial_id):
         return redirect(url_for('home'))
 
     # Récupérer les plannings du commercial sélectionné
-    plannings = Planning.query.filter_by(commercial_id=commercial_id).all()
-    commercial = User.query.get(commercial_id)
+    commercial = commercial_by_id(commercial_id)
+    if not commercial:
+        flash('Commercial non trouvé.', 'error')
+        return redirect(url_for('admin_plannings'))
+    plannings = planning_rows(commercial_id)
 
     return render_template('admin_planning_detail.html', plannings=plannings, commercial=commercial)
 
-@app.route('/commercial_dashboard/<username>', methods=['GET', 'POST'])
+def _roster_params(args):
+    """Semaines ISO demandées (semaine en cours par défaut) et projet ; None si la plage est invalide."""
+    current_week = '{0}-W{1:02d}'.format(*date.today().isocalendar())
+    week_start = args.get('week_start') or current_week
+    week_end = args.get('week_end') or week_start
+    try:
+        weeks = roster_weeks(week_start, week_end)
+    except ValueError as e:
+        flash(f'Semaines invalides : {e}', 'error')
+        return None
+    return {'weeks': weeks, 'week_start': week_start, 'week_end': week_end, 'project': args.get('project') or None}
+
+@app.route('/admin_roster')
+@login_required
+def admin_roster():
+    if current_user.role != 'admin':
+        flash('Accès non autorisé.', 'error')
+        return redirect(url_for('home'))
+
+    # Tous les commerciaux x demi-journées, pour chaque semaine de la plage : une requête, cache par semaine
+    params = _roster_params(request.args)
+    if params is None:
+        return redirect(url_for('admin_roster'))
+    rosters = weekly_rosters(params['weeks'], params['project'])
+    return render_template('admin_roster.html', rosters=rosters, params=params, slots=PLANNING_SLOTS)
+
+@app.route('/admin_roster/export')
+@login_required
+def admin_roster_export():
+    if current_user.role != 'admin':
+        flash('Accès non autorisé.', 'error')
+        return redirect(url_for('home'))
+
+    params = _roster_params(request.args)
+    if params is None:
+        return redirect(url_for('admin_roster'))
+    output = write_roster_xlsx(weekly_rosters(params['weeks'], params['project']))
+    return send_file(output, download_name=f"planning_{params['week_start']}_{params['week_end']}.xlsx",
+                     as_attachment=True)
+
+def _coverage_params(args):
+    """Filtres de couverture : période [date_start, date_end] (aujourd'hui par défaut), structure, demi-journée, projet."""
+    try:
+        start = date.fromisoformat(args.get('date_start') or date.today().isoformat())
+        end = date.fromisoformat(args.get('date_end') or start.isoformat())
+    except ValueError:
+        abort(400)
+    half_day = args.get('half_day') if args.get('half_day') in PLANNING_HALF_DAYS else None
+    return {
+        'start': start,
+        'end': end + timedelta(days=1),
+        'structure': args.get('structure') or None,
+        'half_day': half_day,
+        'project': args.get('project') or None,
+    }
+
+@app.route('/admin_planning_coverage')
+@login_required
+def admin_planning_coverage():
+    if current_user.role != 'admin':
+        flash('Accès non autorisé.', 'error')
+        return redirect(url_for('home'))
+
+    # Quels commerciaux couvrent quelle structure, sur quelles demi-journées : une requête indexée
+    params = _coverage_params(request.args)
+    coverage = planning_coverage(**params)
+    return render_template('admin_planning_coverage.html', coverage=coverage, params=params,
+                           structures=[value for value, _label in PlanningForm.STRUCTURES],
+                           half_days=PLANNING_HALF_DAYS)
+
+@app.route('/api/planning_coverage')
+@login_required
+def api_planning_coverage():
+    if current_user.role != 'admin':
+        abort(403)
+    coverage = planning_coverage(**_coverage_params(request.args))
+    return jsonify(items=[{
+        'date': row.date.isoformat(), 'half_day': row.half_day, 'structure': row.structure,
+        'commercial_id': row.commercial_id, 'username': row.username, 'zone': row.zone,
+    } for row in coverage])
+
+@app.route('/commercial_dashboard/<username>')
 @login_required
 def commercial_dashboard(username):
     if current_user.role not in ['admin', 'commercial']:
         flash('Accès non autorisé.', 'error')
         return redirect(url_for('home'))
-    commercial = User.query.filter_by(username=username).first()
+    commercial = commercial_by_username(username)
     if not commercial:
         flash('Commercial non trouvé.', 'error')
         return redirect(url_for('admin_dashboard'))
-    prospections = commercial.prospections
+    prospections = commercial_prospection_rows(commercial.id)
 
-    # Utilisez ProspectionForm au lieu de DownloadExcelForm
+    # Formulaire d'export (jeton CSRF) : les exports passent par /exports
     form = ProspectionForm()
 
-    # Gérer le téléchargement Excel
-    if request.method == 'POST' and 'download_excel' in request.form:
-        try:
-            # Préparer les données pour le fichier Excel
-            data = [{
-                'Date': p.date.strftime('%Y-%m-%d'),
-                'Nom Client': p.nom_client,
-                'Spécialité': p.specialite,
-                'Structure': p.structure,
-                'Téléphone': p.telephone,
-                'Profils Prospect': p.profils_prospect,
-                'Produits Présentés': p.produits_presentés,
-                'Produits Prescrits': p.produits_prescrits
-            } for p in prospections]
-            df = pd.DataFrame(data)
-
-            # Créer un fichier Excel en mémoire
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False, sheet_name='Prospections')
-            output.seek(0)
-
-            # Renvoyer le fichier Excel en téléchargement
-            return send_file(output, download_name=f'prospections_{username}.xlsx', as_attachment=True)
-        except Exception as e:
-            flash(f'Erreur lors de la génération du fichier Excel : {str(e)}', 'error')
-            logger.error(f"Erreur lors de la génération du fichier Excel : {str(e)}")
-
     return render_template('commercial_dashboard.html', commercial=commercial, prospections=prospections, form=form)
 
-@app.route('/export_pdf/<username>')
+@app.route('/admin_export_excel')
+@login_required
+def admin_export_excel():
+    if current_user.role != 'admin':
+        flash('Accès non autorisé.', 'error')
+        return redirect(url_for('home'))
+
+    # Mêmes filtres que le tableau récapitulatif d'admin_dashboard
+    filters = prospection_filters(request.args)
+    columns, query = filtered_export_query(filters, project=request.args.get('project'))
+    output = write_xlsx(columns, query)
+    return send_file(output, download_name='prospections.xlsx', as_attachment=True)
+
+@app.route('/export_pdf/<username>', methods=['POST'])
 @login_required
 def export_pdf(username):
+    if current_user.role not in ['admin', 'commercial']:
+        flash('Accès non autorisé.', 'error')
+        return redirect(url_for('home'))
     commercial = User.query.filter_by(username=username).first()
-    prospections = commercial.prospections
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    p.drawString(100, 750, f"Prospections de {username}")
-    y = 700
-    for prospection in prospections:
-        p.drawString(100, y, f"Date: {prospection.date}, Client: {prospection.nom_client}")
-        y -= 20
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-    return send_file(buffer, download_name=f'prospections_{username}.pdf', as_attachment=True)
+    if not commercial:
+        flash('Commercial non trouvé.', 'error')
+        return redirect(url_for('admin_dashboard'))
+    # Rapport produit en arrière-plan, comme les exports Excel (voir jobs.py) ; POST seulement :
+    # un préchargement ou un rechargement de page ne doit pas lancer d'export
+    job = submit_export('pdf', {'username': username}, current_user)
+    return redirect(url_for('export_job', job_id=job.id))
+
+@app.route('/admin/cache_stats')
+@login_required
+def admin_cache_stats():
+    if current_user.role != 'admin':
+        abort(403)
+    return jsonify(cache_stats())
+
+@app.route('/admin/sql_stats')
+@login_required
+def admin_sql_stats():
+    if current_user.role != 'admin':
+        abort(403)
+    return jsonify(query_stats_report())
+
+def _get_export_job(job_id):
+    job = db.session.get(ExportJob, job_id)
+    if not job or (job.owner_id != current_user.id and current_user.role != 'admin'):
+        abort(404)
+    return job
+
+@app.route('/exports', methods=['POST'])
+@login_required
+def submit_export_job():
+    if current_user.role not in ['admin', 'commercial']:
+        flash('Accès non autorisé.', 'error')
+        return redirect(url_for('home'))
+
+    kind = request.form.get('kind')
+    if kind == 'excel_all':
+        if current_user.role != 'admin':
+            flash('Accès non autorisé.', 'error')
+            return redirect(url_for('home'))
+        params = {'filters': prospection_filters(request.form), 'project': request.form.get('project')}
+    else:
+        username = request.form.get('username')
+        if not User.query.filter_by(username=username).first():
+            flash('Commercial non trouvé.', 'error')
+            return redirect(url_for('admin_dashboard'))
+        params = {'username': username}
+
+    try:
+        job = submit_export(kind, params, current_user)
+    except ValueError:
+        abort(400)
+    return redirect(url_for('export_job', job_id=job.id))
+
+@app.route('/exports/<job_id>')
+@login_required
+def export_job(job_id):
+    job = _get_export_job(job_id)
+    return render_template('export_job.html', job=job)
+
+@app.route('/exports/<job_id>/status')
+@login_required
+def export_job_status(job_id):
+    job = _get_export_job(job_id)
+    status = job_status(job)
+    if job.status == 'done':
+        status['download_url'] = url_for('export_job_download', job_id=job.id)
+    return jsonify(status)
+
+@app.route('/exports/<job_id>/download')
+@login_required
+def export_job_download(job_id):
+    job = _get_export_job(job_id)
+    if job.status != 'done' or not os.path.exists(job.result_path):
+        abort(404)
+    return send_file(job.result_path, download_name=job.download_name, as_attachment=True)
 
 @app.route('/logout')
 @login_required
@@ -415,153 +471,87 @@ def logout():
     flash('Déconnexion réussie', 'success')
     return redirect(url_for('home'))
 
-@app.route('/nova_pharma_sales', methods=['GET', 'POST'])
-@login_required
-def nova_pharma_sales():
+def _sales_entry(lab_key):
     if current_user.role not in ['admin', 'commercial']:
         flash('Accès non autorisé.', 'error')
         return redirect(url_for('home'))
     
-    # Récupérer les produits de Nova Pharma
-    products = NovaPharmaProduct.query.all()
+    lab = LABS[lab_key]
+    products = Product.query.filter_by(lab=lab_key).order_by(Product.id).all()
     
     if request.method == 'POST':
-        sale_date = request.form.get('sale_date')
-        if not sale_date:
-            flash('Veuillez saisir une date.', 'error')
-            return redirect(url_for('nova_pharma_sales'))
-        
-        for product in products:
-            quantity = request.form.get(f'quantity_{product.id}')
-            price = request.form.get(f'price_{product.id}')
-            
-            if quantity and int(quantity) > 0:
-                sale = NovaPharmaSale(
-                    product_id=product.id,
-                    quantity=int(quantity),
-                    price=float(price),
-                    date=datetime.strptime(sale_date, '%Y-%m-%d'),
-                    commercial_id=current_user.id,
-                    project='nasderm'  # Ajoutez ce champ
-                )
-                db.session.add(sale)
-        
-        db.session.commit()
-        flash('Ventes Nova Pharma enregistrées avec succès', 'success')
-        return redirect(url_for('nova_pharma_sales'))
-    
-    return render_template('nova_pharma_sales.html', products=products)
+        try:
+            # Ventes, agrégat mensuel et stocks enregistrés dans une seule transaction
+            save_sales_entry(lab_key, request.form, products, current_user.id)
+        except SalesFormError as e:
+            for message in e.args[0]:
+                flash(message, 'error')
+            return redirect(request.path)
+        flash(f'Ventes {lab.name} enregistrées avec succès', 'success')
+        return redirect(request.path)
+    
+    return render_template('sales_entry.html', lab=lab, products=products)
+
+@app.route('/ventes/<lab_key>', methods=['GET', 'POST'])
+@login_required
+def lab_sales(lab_key):
+    if lab_key not in LABS:
+        abort(404)
+    return _sales_entry(lab_key)
+
+@app.route('/nova_pharma_sales', methods=['GET', 'POST'])
+@login_required
+def nova_pharma_sales():
+    return _sales_entry('nova_pharma')
 
 @app.route('/gilbert_sales', methods=['GET', 'POST'])
 @login_required
 def gilbert_sales():
-    if current_user.role not in ['admin', 'commercial']:
-        flash('Accès non autorisé.', 'error')
-        return redirect(url_for('home'))
-    
-    # Récupérer les produits de Gilbert
-    products = GilbertProduct.query.all()
-    
-    if request.method == 'POST':
-        sale_date = request.form.get('sale_date')
-        if not sale_date:
-            flash('Veuillez saisir une date.', 'error')
-            return redirect(url_for('gilbert_sales'))
-        
-        for product in products:
-            quantity = request.form.get(f'quantity_{product.id}')
-            price = request.form.get(f'price_{product.id}')
-            
-            if quantity and int(quantity) > 0:
-                sale = GilbertSale(
-                    product_id=product.id,
-                    quantity=int(quantity),
-                    price=float(price),
-                    date=datetime.strptime(sale_date, '%Y-%m-%d'),
-                    commercial_id=current_user.id,
-                    project='nasderm'  # Ajoutez ce champ
-                )
-                db.session.add(sale)
-        
-        db.session.commit()
-        flash('Ventes Gilbert enregistrées avec succès', 'success')
-        return redirect(url_for('gilbert_sales'))
-    
-    return render_template('gilbert_sales.html', products=products)
+    return _sales_entry('gilbert')
 
 @app.route('/eric_favre_sales', methods=['GET', 'POST'])
 @login_required
 def eric_favre_sales():
-    if current_user.role not in ['admin', 'commercial']:
-        flash('Accès non autorisé.', 'error')
-        return redirect(url_for('home'))
-    
-    # Récupérer les produits d'Eric Favre
-    products = EricFavreProduct.query.all()
-    
-    if request.method == 'POST':
-        sale_date = request.form.get('sale_date')
-        if not sale_date:
-            flash('Veuillez saisir une date.', 'error')
-            return redirect(url_for('eric_favre_sales'))
-        
-        for product in products:
-            quantity = request.form.get(f'quantity_{product.id}')
-            price = request.form.get(f'price_{product.id}')
-            
-            if quantity and int(quantity) > 0:
-                sale = EricFavreSale(
-                    product_id=product.id,
-                    quantity=int(quantity),
-                    price=float(price),
-                    date=datetime.strptime(sale_date, '%Y-%m-%d'),
-                    commercial_id=current_user.id,
-                    project='nasmedic'  # Ajoutez ce champ
-                )
-                db.session.add(sale)
-        
-        db.session.commit()
-        flash('Ventes Eric Favre enregistrées avec succès', 'success')
-        return redirect(url_for('eric_favre_sales'))
-    
-    return render_template('eric_favre_sales.html', products=products)
+    return _sales_entry('eric_favre')
 
 @app.route('/trois_chene_sales', methods=['GET', 'POST'])
 @login_required
 def trois_chene_sales():
+    return _sales_entry('trois_chene')
+
+@app.route('/api/stock/<lab_key>')
+@login_required
+def api_stock(lab_key):
     if current_user.role not in ['admin', 'commercial']:
-        flash('Accès non autorisé.', 'error')
-        return redirect(url_for('home'))
-    
-    # Récupérer les produits de 3 Chênes Pharma
-    products = TroisCheneProduct.query.all()
-    
-    if request.method == 'POST':
-        sale_date = request.form.get('sale_date')
-        if not sale_date:
-            flash('Veuillez saisir une date.', 'error')
-            return redirect(url_for('trois_chene_sales'))
-        
-        for product in products:
-            quantity = request.form.get(f'quantity_{product.id}')
-            price = request.form.get(f'price_{product.id}')
-            
-            if quantity and int(quantity) > 0:
-                sale = TroisCheneSale(
-                    product_id=product.id,
-                    quantity=int(quantity),
-                    price=float(price),
-                    date=datetime.strptime(sale_date, '%Y-%m-%d'),
-                    commercial_id=current_user.id,
-                    project='nasmedic'  # Ajoutez ce champ
-                )
-                db.session.add(sale)
-        
-        db.session.commit()
-        flash('Ventes 3 Chênes Pharma enregistrées avec succès', 'success')
-        return redirect(url_for('trois_chene_sales'))
-    
-    return render_template('trois_chene_sales.html', products=products)
+        abort(403)
+    if lab_key not in LABS:
+        abort(404)
+
+    # Stock courant, ou à la fin du jour demandé (?date=AAAA-MM-JJ)
+    at = request.args.get('date')
+    try:
+        stock = stock_at(lab_key, date.fromisoformat(at)) if at else current_stock(lab_key)
+    except ValueError:
+        abort(400)
+    return jsonify([
+        {'product_id': product_id, 'distributor': distributor, 'quantity': quantity}
+        for (product_id, distributor), quantity in sorted(stock.items())
+    ])
+
+@app.route('/api/stock/<lab_key>/movements')
+@login_required
+def api_stock_movements(lab_key):
+    if current_user.role not in ['admin', 'commercial']:
+        abort(403)
+    if lab_key not in LABS:
+        abort(404)
+
+    # Mouvement net par distributeur sur une période (?period=month&value=2024-05)
+    try:
+        start, end = period_range(request.args.get('period', 'month'), request.args.get('value', ''))
+    except ValueError:
+        abort(400)
+    return jsonify(start=start.isoformat(), end=end.isoformat(), movements=movement_totals(lab_key, start, end))
 
 @app.route('/monthly_revenue')
 @login_required
@@ -570,48 +560,10 @@ def monthly_revenue():
         flash('Accès non autorisé.', 'error')
         return redirect(url_for('home'))
     
-    # Calcul du chiffre d'affaire mensuel pour Nova Pharma
-    nova_pharma_revenue = db.session.query(
-        func.strftime('%Y-%m', NovaPharmaSale.date).label('month'),
-        func.sum(NovaPharmaSale.quantity * NovaPharmaSale.price).label('revenue')
-    ).filter(NovaPharmaSale.project == 'nasderm').group_by('month').all()
-    
-    # Calcul du chiffre d'affaire mensuel pour Gilbert
-    gilbert_revenue = db.session.query(
-        func.strftime('%Y-%m', GilbertSale.date).label('month'),
-        func.sum(GilbertSale.quantity * GilbertSale.price).label('revenue')
-    ).filter(GilbertSale.project == 'nasderm').group_by('month').all()
-    
-    # Calcul du chiffre d'affaire mensuel pour 3 Chênes Pharma
-    trois_chene_revenue = db.session.query(
-        func.strftime('%Y-%m', TroisCheneSale.date).label('month'),
-        func.sum(TroisCheneSale.quantity * TroisCheneSale.price).label('revenue')
-    ).filter(TroisCheneSale.project == 'nasmedic').group_by('month').all()
-    
-    # Combiner les résultats dans un dictionnaire
-    revenue_dict = {}
-    for month, revenue in nova_pharma_revenue:
-        revenue_dict[month] = {'nova_pharma_revenue': revenue or 0, 'gilbert_revenue': 0, 'trois_chene_revenue': 0}
-    
-    for month, revenue in gilbert_revenue:
-        if month in revenue_dict:
-            revenue_dict[month]['gilbert_revenue'] = revenue or 0
-        else:
-            revenue_dict[month] = {'nova_pharma_revenue': 0, 'gilbert_revenue': revenue or 0, 'trois_chene_revenue': 0}
-    
-    for month, revenue in trois_chene_revenue:
-        if month in revenue_dict:
-            revenue_dict[month]['trois_chene_revenue'] = revenue or 0
-        else:
-            revenue_dict[month] = {'nova_pharma_revenue': 0, 'gilbert_revenue': 0, 'trois_chene_revenue': revenue or 0}
-    
-    # Convertir le dictionnaire en une liste pour le template
-    monthly_revenue = []
-    for month, revenues in revenue_dict.items():
-        total = revenues['nova_pharma_revenue'] + revenues['gilbert_revenue'] + revenues['trois_chene_revenue']
-        monthly_revenue.append((month, revenues['nova_pharma_revenue'], revenues['gilbert_revenue'], revenues['trois_chene_revenue'], total))
-    
-    return render_template('monthly_revenue.html', monthly_revenue=monthly_revenue)
+    # (mois, Nova Pharma, Gilbert, 3 Chênes Pharma, total), trié par mois
+    # 304 sans recalcul si aucune vente n'a été enregistrée depuis la dernière visite
+    return conditional_page(revenue_last_modified(MONTHLY_REVENUE_LABS), lambda: render_template(
+        'monthly_revenue.html', monthly_revenue=monthly_revenue_table(MONTHLY_REVENUE_LABS)))
 
 @app.route('/monthly_revenue_nasmedic')
 @login_required
@@ -620,36 +572,9 @@ def monthly_revenue_nasmedic():
         flash('Accès non autorisé.', 'error')
         return redirect(url_for('home'))
     
-    # Calcul du chiffre d'affaire mensuel pour Eric Favre
-    eric_favre_revenue = db.session.query(
-        func.strftime('%Y-%m', EricFavreSale.date).label('month'),
-        func.sum(EricFavreSale.quantity * EricFavreSale.price).label('revenue')
-    ).filter(EricFavreSale.project == 'nasmedic').group_by('month').all()
-    
-    # Calcul du chiffre d'affaire mensuel pour 3 Chênes Pharma
-    trois_chene_revenue = db.session.query(
-        func.strftime('%Y-%m', TroisCheneSale.date).label('month'),
-        func.sum(TroisCheneSale.quantity * TroisCheneSale.price).label('revenue')
-    ).filter(TroisCheneSale.project == 'nasmedic').group_by('month').all()
-    
-    # Combiner les résultats dans un dictionnaire
-    revenue_dict = {}
-    for month, revenue in eric_favre_revenue:
-        revenue_dict[month] = {'eric_favre_revenue': revenue or 0, 'trois_chene_revenue': 0}
-    
-    for month, revenue in trois_chene_revenue:
-        if month in revenue_dict:
-            revenue_dict[month]['trois_chene_revenue'] = revenue or 0
-        else:
-            revenue_dict[month] = {'eric_favre_revenue': 0, 'trois_chene_revenue': revenue or 0}
-    
-    # Convertir le dictionnaire en une liste pour le template
-    monthly_revenue = []
-    for month, revenues in revenue_dict.items():
-        total = revenues['eric_favre_revenue'] + revenues['trois_chene_revenue']
-        monthly_revenue.append((month, revenues['eric_favre_revenue'], revenues['trois_chene_revenue'], total))
-    
-    return render_template('monthly_revenue_nasmedic.html', monthly_revenue=monthly_revenue)
+    # (mois, Eric Favre, 3 Chênes Pharma, total), trié par mois
+    return conditional_page(revenue_last_modified(NASMEDIC_LABS), lambda: render_template(
+        'monthly_revenue_nasmedic.html', monthly_revenue=monthly_revenue_table(NASMEDIC_LABS)))
 
 @app.route('/monthly_revenue_nasderm')
 @login_required
@@ -658,36 +583,9 @@ def monthly_revenue_nasderm():
         flash('Accès non autorisé.', 'error')
         return redirect(url_for('home'))
     
-    # Calcul du chiffre d'affaire mensuel pour Nova Pharma
-    nova_pharma_revenue = db.session.query(
-        func.strftime('%Y-%m', NovaPharmaSale.date).label('month'),
-        func.sum(NovaPharmaSale.quantity * NovaPharmaSale.price).label('revenue')
-    ).filter(NovaPharmaSale.project == 'nasderm').group_by('month').all()
-    
-    # Calcul du chiffre d'affaire mensuel pour Gilbert
-    gilbert_revenue = db.session.query(
-        func.strftime('%Y-%m', GilbertSale.date).label('month'),
-        func.sum(GilbertSale.quantity * GilbertSale.price).label('revenue')
-    ).filter(GilbertSale.project == 'nasderm').group_by('month').all()
-    
-    # Combiner les résultats dans un dictionnaire
-    revenue_dict = {}
-    for month, revenue in nova_pharma_revenue:
-        revenue_dict[month] = {'nova_pharma_revenue': revenue or 0, 'gilbert_revenue': 0}
-    
-    for month, revenue in gilbert_revenue:
-        if month in revenue_dict:
-            revenue_dict[month]['gilbert_revenue'] = revenue or 0
-        else:
-            revenue_dict[month] = {'nova_pharma_revenue': 0, 'gilbert_revenue': revenue or 0}
-    
-    # Convertir le dictionnaire en une liste pour le template
-    monthly_revenue = []
-    for month, revenues in revenue_dict.items():
-        total = revenues['nova_pharma_revenue'] + revenues['gilbert_revenue']
-        monthly_revenue.append((month, revenues['nova_pharma_revenue'], revenues['gilbert_revenue'], total))
-    
-    return render_template('monthly_revenue_nasderm.html', monthly_revenue=monthly_revenue)
+    # (mois, Nova Pharma, Gilbert, total), trié par mois
+    return conditional_page(revenue_last_modified(NASDERM_LABS), lambda: render_template(
+        'monthly_revenue_nasderm.html', monthly_revenue=monthly_revenue_table(NASDERM_LABS)))
 
 @app.route('/monthly_revenue_detail_nasmedic/<month>')
 @login_required
@@ -696,21 +594,20 @@ def monthly_revenue_detail_nasmedic(month):
         flash('Accès non autorisé.', 'error')
         return redirect(url_for('home'))
     
-    # Détail des ventes pour Eric Favre
-    eric_favre_sales = db.session.query(
-        EricFavreProduct.name,
-        func.sum(EricFavreSale.quantity).label('total_quantity'),
-        func.sum(EricFavreSale.quantity * EricFavreSale.price).label('total_revenue')
-    ).join(EricFavreSale).filter(func.strftime('%Y-%m', EricFavreSale.date) == month).group_by(EricFavreProduct.name).all()
-    
-    # Détail des ventes pour 3 Chênes Pharma
-    trois_chene_sales = db.session.query(
-        TroisCheneProduct.name,
-        func.sum(TroisCheneSale.quantity).label('total_quantity'),
-        func.sum(TroisCheneSale.quantity * TroisCheneSale.price).label('total_revenue')
-    ).join(TroisCheneSale).filter(func.strftime('%Y-%m', TroisCheneSale.date) == month).group_by(TroisCheneProduct.name).all()
-    
-    return render_template('monthly_revenue_detail_nasmedic.html', month=month, eric_favre_sales=eric_favre_sales, trois_chene_sales=trois_chene_sales)
+    try:
+        start, end = month_range(month)
+    except ValueError:
+        abort(404)
+
+    # Détail des ventes par produit, filtré sur [début du mois, début du mois suivant[
+    def render():
+        eric_favre_sales = product_revenue('eric_favre', start, end, project='nasmedic')
+        trois_chene_sales = product_revenue('trois_chene', start, end, project='nasmedic')
+        return render_template('monthly_revenue_detail_nasmedic.html', month=month, eric_favre_sales=eric_favre_sales, trois_chene_sales=trois_chene_sales)
+
+    # Un mois écoulé ne change plus guère : le navigateur peut le garder longtemps
+    month_key = start.strftime('%Y-%m')
+    return conditional_page(revenue_last_modified(NASMEDIC_LABS, month_key), render, closed_month_max_age(month_key))
     
 @app.route('/monthly_revenue_detail_nasderm/<month>')
 @login_required
@@ -719,21 +616,20 @@ def monthly_revenue_detail_nasderm(month):
         flash('Accès non autorisé.', 'error')
         return redirect(url_for('home'))
     
-    # Détail des ventes pour Nova Pharma
-    nova_pharma_sales = db.session.query(
-        NovaPharmaProduct.name,
-        func.sum(NovaPharmaSale.quantity).label('total_quantity'),
-        func.sum(NovaPharmaSale.quantity * NovaPharmaSale.price).label('total_revenue')
-    ).join(NovaPharmaSale).filter(func.strftime('%Y-%m', NovaPharmaSale.date) == month).group_by(NovaPharmaProduct.name).all()
-    
-    # Détail des ventes pour Gilbert
-    gilbert_sales = db.session.query(
-        GilbertProduct.name,
-        func.sum(GilbertSale.quantity).label('total_quantity'),
-        func.sum(GilbertSale.quantity * GilbertSale.price).label('total_revenue')
-    ).join(GilbertSale).filter(func.strftime('%Y-%m', GilbertSale.date) == month).group_by(GilbertProduct.name).all()
-    
-    return render_template('monthly_revenue_detail_nasderm.html', month=month, nova_pharma_sales=nova_pharma_sales, gilbert_sales=gilbert_sales)    
+    try:
+        start, end = month_range(month)
+    except ValueError:
+        abort(404)
+
+    # Détail des ventes par produit, filtré sur [début du mois, début du mois suivant[
+    def render():
+        nova_pharma_sales = product_revenue('nova_pharma', start, end, project='nasderm')
+        gilbert_sales = product_revenue('gilbert', start, end, project='nasderm')
+        return render_template('monthly_revenue_detail_nasderm.html', month=month, nova_pharma_sales=nova_pharma_sales, gilbert_sales=gilbert_sales)
+
+    # Un mois écoulé ne change plus guère : le navigateur peut le garder longtemps
+    month_key = start.strftime('%Y-%m')
+    return conditional_page(revenue_last_modified(NASDERM_LABS, month_key), render, closed_month_max_age(month_key))    
 
 @app.errorhandler(404)
 def page_not_found(e):
@@ -743,223 +639,76 @@ def page_not_found(e):
 def internal_server_error(e):
     return render_template('500.html'), 500
 
-def create_initial_users():
-    with app.app_context():
-        if not User.query.filter_by(username="Anna Diallo").first():
-            db.session.add(User(username="Anna Diallo", password=generate_password_hash("admin123", method="pbkdf2:sha256"), role="admin", zone=None, project='nasmedic'))
-        commerciaux_nasmedic = [
-            ("KHALIFA DIOP", "khalifa123", "CENTRE VILLE", 'nasmedic'),
-            ("AMADOU DEME", "amadou123", "Banlieue 1", 'nasmedic'),
-            ("MBAYE NDOYE", "mbaye123", "THIES", 'nasmedic'),
-            ("MEDINA K NDIAYE", "medina123", "ZONES INTERMEDIAIRE 2", 'nasmedic'),
-            ("MARIE LOUISE", "marie123", "MBOUR", 'nasmedic'),
-            ("FATOU COLLETTE DRAME", "fatou123", "ZONES INTERMEDIAIRE 1", 'nasmedic'),
-            ("MASSAMBA MBAYE", "massamba123", "Banlieue 2", 'nasmedic'),
-            ("LAMINE THIOUB", "lamine123", "REGION DE DIOURBEL", 'nasmedic'),
-        ]
-        for username, password, zone, project in commerciaux_nasmedic:
-            if not User.query.filter_by(username=username).first():
-                db.session.add(User(username=username, password=generate_password_hash(password, method="pbkdf2:sha256"), role="commercial", zone=zone, project=project))
-        
-        commerciaux_nasderm = [
-            ("FAMA DIOP", "fama123", "CENTRE VILLE", 'nasderm'),
-            ("MARIE JEANNE DIOUF", "marie123", "Banlieue 1", 'nasderm'),
-            ("ASTOU MANA MBENGUE", "astou123", "THIES", 'nasderm'),
-            ("HONORINE", "honorine123", "ZONES INTERMEDIAIRE 2", 'nasderm'),
-            ("MIJO", "mijo123", "MBOUR", 'nasderm'),
-            ("HELENE FAYE", "helene123", "ZONES INTERMEDIAIRE 1", 'nasderm'),
-            ("ADJARA CISSÉ", "adjara123", "Banlieue 2", 'nasderm'),
-            ("KHAR FALL", "khar123", "REGION DE DIOURBEL", 'nasderm'),
-            ("KHADY SOW", "khady123", "REGION DE DIOURBEL", 'nasderm'),
-        ]
-        for username, password, zone, project in commerciaux_nasderm:
-            if not User.query.filter_by(username=username).first():
-                db.session.add(User(username=username, password=generate_password_hash(password, method="pbkdf2:sha256"), role="commercial", zone=zone, project=project))
-        
-        db.session.commit()
-
-def create_initial_products():
-    with app.app_context():
-        # Produits Nova Pharma
-        nova_pharma_products = [
-            ("HYFAC GEL NETTOYANT FLC 150ML", 3.5),
-            ("HYFAC GEL NETTOYANT TB 300ML", 3.5),
-            ("HYFAC PAIN NETTOYANT 100G SOUS ETUI", 3.5),
-            ("HYFAC MOUSSE NETTOYANTE FLC150ML", 3.5),
-            ("HYFAC SOIN GLOBAL FLC40ML/ETUI", 3.5),
-            ("HYFAC ETUI 2X15 PATCHS IMPERFECTIONS", 3.5),
-            ("HYFAC MOUSSE A RASER SENSITIVE FLC150ML", 3.5),
-            ("HYFAC SUN SPF 50+ INV TB 40ML SS ETUI", 3.5),
-            ("CLARIFAC Soin anti-taches 40ML", 3.5),
-            ("HYFAC WOMAN SOIN GLOBAL TB 40ML/ETUI", 3.5),
-            ("HYFAC WOMAN LOTION VISAGE FL 200 ML", 3.5),
-            ("HYFAC WOMAN ACTIVE MASK 15*5ML", 3.5),
-            ("HYDRAFAC CREME HYDRA LEGERE TUBE40 ML", 3.5),
-        ]
-        for name, price in nova_pharma_products:
-            if not NovaPharmaProduct.query.filter_by(name=name).first():
-                db.session.add(NovaPharmaProduct(name=name, default_price=price))
-
-        # Produits Gilbert
-        gilbert_products = [
-            ("ELLE TEST BTE DE 1 TEST GROSSESSE", 3.5),
-            ("MOUSTIDOSE SPRAY REPULSIF ZONE INFESTEES IR3535 +12M  100ML", 3.5),
-            ("MOUSTIDOSE SPRAY REPULSIF ACTIF VÉGÉTAL +6M 100ML", 3.5),
-            ("MOUSTIDOSE SPRAY REPULSIF ZONE TRES INFESTEES ICARIDINE  +24M 100ML", 3.5),
-            ("MOUSTIDOSE CREME SOIN CALMANT  40ML", 3.5),
-            ("WATERWIPES LINGETTES BD BB 4X60", 3.5),
-            ("WATERWIPES LINGETTES BD BB X60", 3.5),
-            ("WATERWIPES LINGETTES BD BB X28", 3.5),
-            ("LEL SUCE NOUVEAU NE SYM ROSE PANACH 2X3", 3.5),
-            ("LEL SUCE NOUVEAU NE SYM BLEU PANACHE 2X3", 3.5),
-            ("LEL SUCE NOUVEAU NE SYM JAUNE", 3.5),
-            ("LEL DUO SUCE ANA 0-6M LAPIN + CŒUR", 3.5),
-            ("LEL DUO SUCE ANA 0-6M RENARD + CŒUR", 3.5),
-            ("LEL SUCE 0-6M ANA MAMAN ANNEAU", 3.5),
-            ("LEL SUCE 0-6M ANA PAPA ANNEAU", 3.5),
-            ("LEL SUCE NUIT 0-6M ANA ELEPH BLEU ANNEAU", 3.5),
-            ("LEL SUCE NUIT  0-6M ANA ELEPH ROSE ANNEAU", 3.5),
-            ("SUCETTE 0-6 MOIS PHYSIOLOGIQUE (BÉBÉ ALLAITÉ) ELEPHANT", 3.5),
-            ("LEL SUCE 0-6M PHYS BB AMOUR ANNEAU", 3.5),
-            ("LEL SUCE 6-18M ANA BEBE AMOUR ANNEAU", 3.5),
-            ("LEL SUCE 6-18M ANA MAMAN ANNEAU", 3.5),
-            ("LEL SUCE 6-18M ANA PAPA ANNEAU", 3.5),
-            ("LEL SUCE 6-18M PHYS DIS MOI  ANNEAU", 3.5),
-            ("LEL SUCE +18M ANA JAIME PARENTS ANNEAU", 3.5),
-            ("LEL BIBERON PLASTIQUE 150ML SAVANE PP", 3.5),
-            ("LEL BIBERON ERGOSENSE 270ML SAVANE PP", 3.5),
-            ("LEL BIBERON PLASTIQUE 330ML SAVANE PP", 3.5),
-            ("LEL BIBERON VERRE 120ML", 3.5),
-            ("LEL BIBERON VERRE 240ML", 3.5),
-            ("LEL TETINE ERGOSENSE SIL. DEB. LENT (X2)", 3.5),
-            ("LEL TETINE ERGOSENSE SIL. DEB. MOY (X2)", 3.5),
-            ("LEL TETINE ERGOSENSE SIL.DEB.VAR (X2)", 3.5),
-            ("LEL TETINE ERGOSENSE DEB. LIQ.EPAIS (X2)", 3.5),
-            ("LEL ATTACHE SUCETTE 2023", 3.5),
-            ("LEL ANNEAU DENTITION FORME HOCHET", 3.5),
-            ("LEL COUPE ONGLES BEBE", 3.5),
-            ("LEL CISEAUX DROITS", 3.5),
-            ("LEL 60 BATONNETS EMBOUT BEBE", 3.5),
-            ("LEL GOUPILLON", 3.5),
-            ("NEUTRADERM BAUME RELIPIDANT 400ML RELIPID +", 3.5),
-            ("NEUTRADERM BAUME RELIPIDANT 200ML RELIPID +", 3.5),
-            ("NEUTRADERM HUILE LAVANTE RELIPIDANTE 400ML RELIPID +", 3.5),
-            ("NEUTRADERM HUILE LAVANTE RELIPIDANTE 1L RELIPID +", 3.5),
-            ("NEUTRADERM CREME DE DOUCHE RELIPIDANTE 400ML RELIPID +", 3.5),
-            ("NEUTRADERM CREME DE DOUCHE RELIPIDANTE 200ML RELIPID +", 3.5),
-            ("NEUTRADERM GEL DOUCHE SURGRAS DERMO-PROTECTEUR TB 200ML", 3.5),
-            ("NEUTRADERM GEL DOUCHE SURGRAS DERMO-PROTECTEUR 500ML", 3.5),
-            ("NEUTRADERM GEL DOUCHE SURGRAS DERMO-PROTECTEUR 1 LITRE", 3.5),
-            ("NEUTRADERM SAVON SURGRAS DERMO-PROTECTEUR 200G", 3.5),
-            ("NEUTRADERM GEL CREME NOURISSANT DERMO-PROTECTEUR TB 200ML", 3.5),
-            ("NEUTRADERM GEL CREME NOURISSANT DERMO-PROTECTEUR 400ML", 3.5),
-            ("NEUTRADERM GEL DOUCHE MICELLAIRE DERMO-APAISANT 1L", 3.5),
-            ("NEUTRADERM GEL CREME HYDRATANT DERMO-APAISANT TB 200ML", 3.5),
-            ("NEUTRADERM GEL CREME HYDRATANT DERMO-APAISANT 400ML", 3.5),
-            ("NEUTRADERM BABY GEL NETTOYANT DOUCEUR 3 EN 1 TB 200ML", 3.5),
-            ("NEUTRADERM BABY GEL NETTOYANT DOUCEUR 3 EN 1 FL. POMPE 400ML", 3.5),
-            ("NEUTRADERM BABY EAU NETTOYANTE DOUCEUR 3 EN 1 FL. CAPS. 200ML", 3.5),
-            ("NEUTRADERM BABY EAU NETTOYANTE DOUCEUR 3 EN 1 FL. POMPE 1L", 3.5),
-            ("NEUTRADERM BABY CREME HYDRATANTE APAISANTE TB AVEC ETUI 100ML", 3.5),
-            ("NEUTRADERM SOIN LAVANT DOUCEUR INTIME FL250ML", 3.5),
-            ("NEUTRADERM SOIN LAVANT DOUCEUR INTIME FL500ML", 3.5),
-            ("NEUTRADERM CRÈME APAISANTE DOUCEUR INTIME 40ML", 3.5),
-            ("NEUTRADERM BRUME D'EAU, SOIN APAISANT 150ML", 3.5),
-            ("NEUTRADERM BRUME D'EAU, SOIN APAISANT 300ML", 3.5),
-            ("LAINO GEL CREME  HYDRATANTE ANTI OXYDANT 40ML REPACK", 3.5),
-            ("LAINO CREME NOURRISSANTE ANTI OXYDANT 40ML REPACK", 3.5),
-            ("LAINO SERUM HYDRATANT ANTI OXYDANT 30ML REPACK", 3.5),
-            ("LAINO CONTOUR DES YEUX HYDRATANT 15ML REPACK", 3.5),
-            ("LAINO GEL NETTOYANT DEMAQUILLANT 200ML REPACK", 3.5),
-            ("LAINO GOMMAGE HYDRATANT TB75ML", 3.5),
-            ("LAINO MASQUE HYDRATANT TB75ML", 3.5),
-            ("LAINO LAIT HYDRATANT AMANDE DOUCE FL400ML", 3.5),
-            ("LAINO SOIN NUTRITIF INTENSE OLIVE FLC400ML", 3.5),
-            ("LAINO LAIT NUTRI CONFORT KARITE FLC400ML", 3.5),
-            ("LAINO LAIT NUTRI BIEN ETRE ROSE  FL400ML", 3.5),
-            ("LAINO LAIT NUTRI FERMETE ARGAN FLC400ML", 3.5),
-            ("LAINO SAVON SOUFRE  SOUS ETUI 150G", 3.5),
-            ("LAINO SOIN LEVRE PRO INTENSE STICK 4G", 3.5),
-            ("LAINO SOIN LEVRES FIGUE 4G huiles végétales", 3.5),
-            ("LAI SOIN DES LEVRES FRAISE 4G", 3.5),
-            ("LAI SOIN DES LEVRES VANILLE 4G", 3.5),
-            ("LAI SOIN DES LEVRES GRENADINE 4G", 3.5),
-            ("LAI SOIN DES LEVRES COCO 4G", 3.5),
-            ("LAI SOIN DES LEVRES FRAMBOISE 4G", 3.5),
-            ("LAI SOIN DES LEVRES CERISE 4G", 3.5),
-            ("LAI SOIN DES LEVRES POMME 4G", 3.5),
-            ("LAI SOIN DES LEVRES CASSIS 4G", 3.5),
-            ("LAINO CREME MAIN PRO INTENSE TB50ML", 3.5),
-            ("LAINO SAVON SOLIDE D'ALEP ETUI150GR", 3.5),
-            ("LAINO SAVON LIQ MARSEILLE FLC300ML", 3.5),
-            ("LAINO L'AUTHENTIQUE SAVON MARSEILLE 150G", 3.5),
-            ("LAINO PATE ARGILE VERTE TB350G", 3.5),
-            ("LAINO ARGILE POUDRE SURFINE ETUI300G", 3.5),
-            ("LAINO EAU DE ROSE FLC250ML", 3.5),
-            ("LAINO EAU FLORALE DE BLEUET FLC250ML", 3.5),
-            ("LAINO EAU DE FLEUR D'ORANGER FLC250ML", 3.5),
-        ]
-        for name, price in gilbert_products:
-            if not GilbertProduct.query.filter_by(name=name).first():
-                db.session.add(GilbertProduct(name=name, default_price=price))
-
-        # Produits Eric Favre
-        eric_favre_products = [
-            ("Chronoerect", 3.58),
-            ("Special Kid calcium", 2.65),
-            ("Special Kid Fer", 2.65),
-            ("Special kid immunite", 3.00),
-            ("Special Kid multivit", 2.65),
-            ("Special Kid nez et gorge", 2.65),
-            ("Special kid nutri+", 2.65),
-            ("Special kid probiotiques", 8.56),
-            ("Special kid rehydratation", 2.65),
-            ("Special kid sol spray nasal F/50ML", 2.65),
-            ("Special Kid sommeil", 2.65),
-            ("Special kid Soulage doux", 2.65),
-            ("Special kid Zinc", 2.65),
-            ("Time Sex Control", 6.90),
-            ("Appetit Plus", 2.34),
-        ]
-        for name, price in eric_favre_products:
-            if not EricFavreProduct.query.filter_by(name=name).first():
-                db.session.add(EricFavreProduct(name=name, default_price=price))
-
-        # Produits 3 Chênes Pharma
-        trois_chene_products = [
-            ("ASTHE 1000", 6.05),
-            ("BOIS BANDE", 3.45),
-            ("CARBOLINE CPR B/30", 2.40),
-            ("DIARILIUM ENFANT SOL BUV", 1.95),
-            ("DIARILIUM SOL BV UNICADOSE", 2.64),
-            ("DYSMECALM CPR B/15", 2.90),
-            ("EASY MOM GROSSESSE GEL B/30", 3.70),
-            ("EFIRUB CPR B/30", 3.50),
-            ("EFIRUB PDRE SOL BUV SACH B/8", 3.45),
-            ("FLATUPLEXIN", 4.80),
-            ("MYOCALM", 3.55),
-            ("OSTEOPHYTUM CP", 7.50),
-            ("OSTEOPHYTUM GEL 100ML", 4.75),
-            ("OSTEOPHYTUM PATCH/14", 2.55),
-            ("SEDABUCCIL", 3.60),
-            ("SOMNIPLEX MELATONINE CPR", 5.20),
-            ("VAGALINE SPRAY BUCCAL F/25ML", 3.75),
-            ("VAGALINE CPR B/15", 2.45),
-            ("SPRAY NASAL", 3.75),
-            ("MYOCALM ROLL ON 50ML", 4.20),
-            ("MYOCALM SPRAY 100ML", 4.25),
-            ("INFLAKIN/30", 8.95),
-            ("INFLAKIN/10", 5.15),
-        ]
-        for name, price in trois_chene_products:
-            if not TroisCheneProduct.query.filter_by(name=name).first():
-                db.session.add(TroisCheneProduct(name=name, default_price=price))
-
-        db.session.commit()
+@app.cli.command('rebuild-revenue-rollup')
+def rebuild_revenue_rollup_command():
+    """Recalcule la table monthly_revenue_rollup à partir des ventes."""
+    rows = rebuild_revenue_rollup()
+    print(f"monthly_revenue_rollup reconstruite : {rows} lignes")
+
+@app.cli.command('compact-stock-ledger')
+def compact_stock_ledger_command():
+    """Reporte les mouvements de stock récents dans la table stock_snapshot."""
+    count = compact_stock_ledger()
+    print(f"{count} mouvements de stock compactés")
+
+@app.cli.command('seed')
+@click.option('--workers', type=int, default=None, help='Processus pour le hachage des mots de passe.')
+@click.option('--password-method', default=None, help='Méthode de hachage (défaut : SEED_PASSWORD_METHOD ou pbkdf2:sha256).')
+def seed_command(workers, password_method):
+    """Insère les utilisateurs et produits initiaux manquants."""
+    users, products = seed(workers, password_method)
+    print(f"{users} utilisateurs et {products} produits ajoutés")
+
+@app.cli.command('bench')
+@click.option('--commerciaux', type=int, default=20, show_default=True, help='Commerciaux par projet.')
+@click.option('--prospections', type=int, default=20000, show_default=True, help='Prospections au total.')
+@click.option('--sales', type=int, default=20000, show_default=True, help='Ventes par laboratoire.')
+@click.option('--plannings', type=int, default=20, show_default=True, help='Plannings par commercial.')
+@click.option('--iterations', type=int, default=20, show_default=True, help='Appels mesurés par route.')
+@click.option('--seed', 'random_seed', type=int, default=0, show_default=True, help='Graine du générateur aléatoire.')
+@click.option('--warm-cache', is_flag=True, help='Mesure avec le cache configuré (défaut : à froid, NullCache).')
+@click.option('--baseline', 'baseline_path', default=None,
+              help='Fichier JSON de référence (défaut : instance/bench_baseline.json, ou bench_baseline_warm.json).')
+@click.option('--save-baseline', is_flag=True, help='Enregistre les résultats comme nouvelle référence.')
+@click.option('--tolerance', type=float, default=0.25, show_default=True, help='Dégradation tolérée (latence p95, mémoire).')
+@click.option('--keep-data', is_flag=True, help='Conserve les données générées.')
+def bench_command(commerciaux, prospections, sales, plannings, iterations, random_seed, warm_cache, baseline_path,
+                  save_baseline, tolerance, keep_data):
+    """Génère un jeu de données synthétique et mesure les pages principales (base dédiée uniquement)."""
+    # Mesures à froid et avec cache : références distinctes
+    baseline_path = baseline_path or os.path.join(
+        app.instance_path, 'bench_baseline_warm.json' if warm_cache else 'bench_baseline.json'
+    )
+    try:
+        bench.prepare_database()
+    except bench.BenchError as e:
+        raise click.ClickException(str(e))
+    try:
+        counts = bench.generate_data(commerciaux, prospections, sales, plannings, seed=random_seed)
+        print(', '.join(f'{count} {table}' for table, count in counts.items()) + ' générés')
+        results = bench.run_routes(app, iterations, warm_cache)
+    except bench.BenchError as e:
+        raise click.ClickException(str(e))
+    finally:
+        if not keep_data:
+            db.session.rollback()
+            db.drop_all()
+
+    baseline = bench.load_baseline(baseline_path)
+    print(bench.format_report(results, baseline))
+    if save_baseline:
+        bench.save_baseline(baseline_path, results)
+        print(f"Référence enregistrée dans {baseline_path}")
+    elif baseline is None:
+        print(f"Aucune référence ({baseline_path}) : relancer avec --save-baseline pour en créer une")
+    else:
+        regressions = bench.compare(results, baseline, tolerance)
+        if regressions:
+            raise click.ClickException('Régressions de performance :\n  ' + '\n  '.join(regressions))
+        print("Aucune régression par rapport à la référence")
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
-        create_initial_users()
-        create_initial_products()
+        seed()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""Compression des réponses et ressources statiques versionnées.
+
+Les réponses HTML, JSON et CSS dépassant COMPRESS_MIN_SIZE octets sont
+compressées en brotli ou en gzip selon l'en-tête Accept-Encoding du client.
+Leur ETag reçoit alors le suffixe de l'encodage ("abc-gzip") ; le suffixe est
+retiré des If-None-Match reçus, pour que les réponses 304 fonctionnent quel
+que soit l'encodage.
+
+static_url('css/styles.css') renvoie /assets/css/styles.<empreinte>.css :
+l'empreinte change avec le contenu du fichier, qui peut donc être mis en
+cache un an par le navigateur (Cache-Control: immutable).
+"""
+import gzip
+import hashlib
+import os
+import re
+import threading
+
+import brotli
+from flask import abort, current_app, request, send_from_directory, url_for
+
+COMPRESSIBLE_TYPES = {'text/html', 'application/json', 'text/css', 'application/javascript', 'text/javascript'}
+ENCODINGS = ['br', 'gzip']
+
+ASSET_MAX_AGE = 365 * 24 * 3600
+FINGERPRINT_LENGTH = 12
+
+_FINGERPRINTED = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % FINGERPRINT_LENGTH)
+_ENCODING_SUFFIX = re.compile(r'-(?:%s)"' % '|'.join(ENCODINGS))
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def _setting(app, name, default):
+    return type(default)(app.config.get(name, os.environ.get(name, default)))
+
+
+def _fingerprint(path):
+    """Empreinte du contenu d'un fichier, recalculée seulement s'il a été modifié."""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _fingerprints_lock:
+        digest = _fingerprints.get(key)
+    if digest is None:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:FINGERPRINT_LENGTH]
+        with _fingerprints_lock:
+            _fingerprints[key] = digest
+    return digest
+
+
+def static_url(filename):
+    """URL versionnée d'un fichier de static/ ; url_for('static') si le fichier est introuvable."""
+    path = os.path.join(current_app.static_folder, filename)
+    if not os.path.isfile(path):
+        return url_for('static', filename=filename)
+    stem, ext = os.path.splitext(filename)
+    return url_for('static_asset', filename=f'{stem}.{_fingerprint(path)}{ext}')
+
+
+def _compress(data, encoding, app):
+    if encoding == 'br':
+        return brotli.compress(data, quality=_setting(app, 'COMPRESS_BROTLI_QUALITY', 5))
+    return gzip.compress(data, compresslevel=_setting(app, 'COMPRESS_GZIP_LEVEL', 6), mtime=0)
+
+
+def _negotiate(app):
+    accepted = [encoding for encoding in ENCODINGS if request.accept_encodings[encoding]]
+    if not accepted:
+        return None
+    return max(accepted, key=lambda encoding: request.accept_encodings[encoding])
+
+
+def configure_assets(app):
+    """Ajoute la route /assets et la compression des réponses ; à appeler avant les autres hooks after_request."""
+    min_size = _setting(app, 'COMPRESS_MIN_SIZE', 1024)
+    app.add_template_global(static_url)
+
+    @app.route('/assets/<path:filename>')
+    def static_asset(filename):
+        match = _FINGERPRINTED.match(filename)
+        if not match:
+            abort(404)
+        original = match['stem'] + match['ext']
+        path = os.path.join(app.static_folder, original)
+        if not os.path.isfile(path):
+            abort(404)
+        if _fingerprint(path) != match['digest']:
+            # Page rendue avant la mise à jour du fichier : contenu actuel, sans cache durable
+            return send_from_directory(app.static_folder, original, max_age=0)
+
+        response = send_from_directory(app.static_folder, original, max_age=ASSET_MAX_AGE)
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        if response.mimetype in COMPRESSIBLE_TYPES:
+            # Petits fichiers texte : lus en mémoire pour pouvoir être compressés
+            response.direct_passthrough = False
+            response.make_sequence()
+        return response
+
+    @app.before_request
+    def _strip_encoding_from_etags():
+        # "abc-gzip" désigne la même version que "abc" : on compare sans le suffixe
+        if_none_match = request.environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            request.environ['HTTP_IF_NONE_MATCH'] = _ENCODING_SUFFIX.sub('"', if_none_match)
+
+    @app.after_request
+    def _compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = _negotiate(app)
+        data = response.get_data()
+        if encoding is None or len(data) < min_size:
+            return response
+
+        response.set_data(_compress(data, encoding, app))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+        return response
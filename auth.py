@@ -0,0 +1,132 @@
+"""Chargement de l'utilisateur connecté, mis en cache dans chaque processus.
+
+Flask-Login recharge l'utilisateur à chaque requête authentifiée. Seuls les
+champs utiles à la session (id, username, role, zone, project) sont gardés,
+dans un cache LRU borné (USER_CACHE_SIZE entrées) dont les entrées expirent
+après USER_CACHE_TTL secondes. Une modification d'utilisateur validée dans ce
+processus l'évince aussitôt ; dans les autres workers, elle s'applique au plus
+tard à l'expiration de l'entrée.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, User
+
+SESSION_FIELDS = ['id', 'username', 'role', 'zone', 'project']
+
+
+class SessionUser(UserMixin):
+    """Copie détachée des champs de User nécessaires à la session."""
+
+    def __init__(self, id, username, role, zone, project):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.zone = zone
+        self.project = project
+
+    def __repr__(self):
+        return f'<SessionUser {self.id} {self.username}>'
+
+
+class UserCache:
+    """Cache LRU à expiration, protégé par un verrou (les workers peuvent être multi-threads)."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_ids=None):
+        """Évince les utilisateurs donnés, ou tout le cache si user_ids vaut None."""
+        with self._lock:
+            if user_ids is None:
+                self._entries.clear()
+            for user_id in user_ids or ():
+                self._entries.pop(user_id, None)
+
+
+_cache = None
+
+
+def configure_user_cache(app):
+    global _cache
+    app.config.setdefault('USER_CACHE_SIZE', int(os.environ.get('USER_CACHE_SIZE', 256)))
+    app.config.setdefault('USER_CACHE_TTL', int(os.environ.get('USER_CACHE_TTL', 60)))
+    _cache = UserCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+
+def load_session_user(user_id):
+    """Utilisateur de la session, sans requête SQL s'il est en cache."""
+    user_id = int(user_id)
+    user = _cache.get(user_id)
+    if user is None:
+        row = db.session.query(*[getattr(User, field) for field in SESSION_FIELDS]).filter(
+            User.id == user_id
+        ).first()
+        if row is None:
+            return None
+        user = SessionUser(*row)
+        _cache.set(user_id, user)
+    return user
+
+
+# Éviction au commit des utilisateurs modifiés ou supprimés
+
+@event.listens_for(Session, 'before_flush')
+def _track_users(session, flush_context, instances):
+    changed = session.info.setdefault('changed_users', set())
+    if changed is None:
+        return
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_user_statements(orm_execute_state):
+    # UPDATE / DELETE groupés : on ne sait pas quelles lignes changent
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and table.name == User.__table__.name:
+            orm_execute_state.session.info['changed_users'] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _evict_on_commit(session):
+    if 'changed_users' not in session.info:
+        return
+    changed = session.info.pop('changed_users')
+    if _cache is not None and changed != set():
+        _cache.evict(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('changed_users', None)
@@ -0,0 +1,307 @@
+"""Jeu de données synthétique et mesure des pages principales (commande `flask bench`).
+
+La commande remplit une base vide par INSERT groupés, appelle les routes via
+le client de test de Flask et mesure pour chacune la latence (p50 / p95), le
+nombre de requêtes SQL (en-tête X-SQL-Stats) et le pic de mémoire Python
+(tracemalloc). Les résultats sont comparés à une référence enregistrée :
+toute dégradation au-delà de la tolérance fait échouer la commande.
+
+Par défaut les pages sont mesurées à froid : cache de requêtes désactivé
+(NullCache) et PDF en cache supprimés avant chaque appel. --warm-cache mesure
+au contraire avec le cache configuré, donc surtout des lectures du cache.
+Les exports passent par la file d'attente (/exports) : la latence mesurée va
+de la soumission à la fin du téléchargement.
+
+À lancer sur une base dédiée, par exemple :
+    DATABASE_URL=sqlite:///bench.db flask bench
+"""
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from sqlalchemy import func, insert
+from werkzeug.security import generate_password_hash
+
+from caching import cache
+from models import db, Planning, PlanningSlot, Product, Prospection, Sale, User
+from plannings import PLANNING_SLOTS, planning_slots
+from revenue import LABS, rebuild_revenue_rollup
+from seed import seed_products
+
+BATCH_SIZE = 5000
+# Durée maximale d'un export mesuré, en secondes
+EXPORT_TIMEOUT = 120
+
+ZONES = ['CENTRE VILLE', 'Banlieue 1', 'Banlieue 2', 'THIES', 'MBOUR', 'ZONES INTERMEDIAIRE 1',
+         'ZONES INTERMEDIAIRE 2', 'REGION DE DIOURBEL']
+SPECIALITES = ['GENERALISTE', 'PEDIATRE', 'GYNECOLOGUE', 'DERMATOLOGUE', 'ORL', 'SAGE-FEMME', 'PHARMACIEN']
+STRUCTURES = ['HOPITAL', 'POSTE DE SANTE', 'CENTRE DE SANTE', 'CLINIQUE', 'SAPEUR POMPIER', 'GENDARMERIES',
+              'PHARMACIES']
+
+ADMIN = ('Bench Admin', 'bench')
+
+
+class BenchError(Exception):
+    pass
+
+
+def _bulk_insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def _random_day(rng, days):
+    return date.today() - timedelta(days=rng.randrange(days))
+
+
+def prepare_database():
+    """Crée les tables ; refuse une base qui contient déjà des utilisateurs."""
+    db.create_all()
+    if db.session.query(func.count(User.id)).scalar():
+        raise BenchError("La base contient déjà des utilisateurs : lancez le bench sur une base dédiée "
+                         "(DATABASE_URL=sqlite:///bench.db flask bench).")
+
+
+def generate_data(commerciaux=20, prospections=20000, sales=20000, plannings=20, days=365, seed=0):
+    """Remplit la base préparée ; renvoie le nombre de lignes insérées par table."""
+    rng = random.Random(seed)
+
+    # Un seul hachage peu coûteux pour tous les comptes du bench
+    password = generate_password_hash(ADMIN[1], method='pbkdf2:sha256:1000')
+    users = [{'username': ADMIN[0], 'password': password, 'role': 'admin', 'zone': None, 'project': 'nasmedic'}]
+    for project in ('nasmedic', 'nasderm'):
+        for i in range(commerciaux):
+            users.append({'username': f'{project.upper()} {i:03d}', 'password': password,
+                          'role': 'commercial', 'zone': rng.choice(ZONES), 'project': project})
+    _bulk_insert(User, users)
+    seed_products()
+
+    commercial_ids = [row.id for row in db.session.query(User.id).filter(User.role == 'commercial')]
+    _bulk_insert(Prospection, [{
+        'commercial_id': rng.choice(commercial_ids),
+        'date': _random_day(rng, days),
+        'nom_client': f'Client {i}',
+        'specialite': rng.choice(SPECIALITES),
+        'structure': rng.choice(STRUCTURES),
+        'telephone': f'77{rng.randrange(10 ** 7):07d}',
+        'profils_prospect': 'Prescripteur',
+        'produits_presentés': 'Gamme complète',
+        'produits_prescrits': '',
+    } for i in range(prospections)])
+
+    products = db.session.query(Product.id, Product.lab, Product.default_price).all()
+    sale_rows = []
+    for lab in LABS.values():
+        lab_products = [product for product in products if product.lab == lab.key]
+        for _ in range(sales):
+            product = rng.choice(lab_products)
+            sale_rows.append({
+                'lab': lab.key, 'product_id': product.id, 'quantity': rng.randint(1, 20),
+                'price': product.default_price, 'date': _random_day(rng, days),
+                'commercial_id': rng.choice(commercial_ids), 'project': lab.project,
+            })
+    _bulk_insert(Sale, sale_rows)
+
+    planning_rows, planning_weeks = [], []
+    for commercial_id in commercial_ids:
+        for week in range(plannings):
+            week_start = date.today() - timedelta(weeks=week)
+            slots = {slot: rng.sample(STRUCTURES, rng.randint(0, 2)) for slot in PLANNING_SLOTS}
+            row = {'commercial_id': commercial_id, 'date': week_start}
+            row.update({slot: ', '.join(structures) for slot, structures in slots.items()})
+            planning_rows.append(row)
+            planning_weeks.append((commercial_id, week_start, slots))
+    # Ids des plannings insérés renvoyés dans l'ordre des lignes, pour y rattacher les demi-journées
+    planning_ids = []
+    for start in range(0, len(planning_rows), BATCH_SIZE):
+        planning_ids += db.session.scalars(
+            insert(Planning).returning(Planning.id, sort_by_parameter_order=True),
+            planning_rows[start:start + BATCH_SIZE]
+        ).all()
+    slot_rows = [row for planning_id, (commercial_id, week_start, slots) in zip(planning_ids, planning_weeks)
+                 for row in planning_slots(planning_id, commercial_id, week_start, slots)]
+    _bulk_insert(PlanningSlot, slot_rows)
+    db.session.commit()
+    rebuild_revenue_rollup()
+
+    return {'user': len(users), 'prospection': prospections, 'sale': len(sale_rows), 'planning': len(planning_rows),
+            'planning_slot': len(slot_rows)}
+
+
+def bench_routes():
+    """(nom, méthode, URL, données) des pages mesurées ; la méthode EXPORT désigne un export en file d'attente."""
+    commercial = db.session.query(User.username).filter(User.role == 'commercial').order_by(User.id).first()[0]
+    month = date.today().strftime('%Y-%m')
+    week_start = date.today() - timedelta(days=6)
+    return [
+        ('admin_dashboard', 'GET', '/admin_dashboard', None),
+        ('nasmedic_dashboard', 'GET', '/nasmedic_dashboard', None),
+        ('nasderm_dashboard', 'GET', '/nasderm_dashboard', None),
+        ('monthly_revenue', 'GET', '/monthly_revenue', None),
+        ('monthly_revenue_nasmedic', 'GET', '/monthly_revenue_nasmedic', None),
+        ('monthly_revenue_nasderm', 'GET', '/monthly_revenue_nasderm', None),
+        ('monthly_revenue_detail_nasmedic', 'GET', f'/monthly_revenue_detail_nasmedic/{month}', None),
+        ('monthly_revenue_detail_nasderm', 'GET', f'/monthly_revenue_detail_nasderm/{month}', None),
+        ('commercial_dashboard', 'GET', f'/commercial_dashboard/{commercial}', None),
+        ('export_excel', 'EXPORT', '/exports', {'kind': 'excel', 'username': commercial}),
+        ('export_pdf', 'EXPORT', '/exports', {'kind': 'pdf', 'username': commercial}),
+        ('admin_roster', 'GET', f"/admin_roster?week_start={date.today().strftime('%G-W%V')}", None),
+        ('planning_coverage', 'GET', f'/admin_planning_coverage?structure=HOPITAL&date_start={week_start}&date_end={date.today()}', None),
+    ]
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _query_count(response):
+    for item in response.headers.get('X-SQL-Stats', '').split(';'):
+        name, _, value = item.strip().partition('=')
+        if name == 'queries':
+            return int(value)
+    return None
+
+
+def _get(client, url):
+    response = client.get(url)
+    body = response.get_data()  # consomme les réponses en streaming
+    if response.status_code != 200:
+        raise BenchError(f'GET {url} : statut {response.status_code}')
+    return response, body
+
+
+def _run_export(client, url, data):
+    """Soumet un export, attend la fin du job puis télécharge le fichier.
+
+    Requêtes SQL comptées : soumission et téléchargement (le nombre d'appels
+    d'état dépend de la durée du job).
+    """
+    submitted = client.post(url, data=data)
+    if submitted.status_code != 302:
+        raise BenchError(f'POST {url} : statut {submitted.status_code}')
+    job_url = submitted.headers['Location']
+    deadline = time.monotonic() + EXPORT_TIMEOUT
+    while True:
+        _response, body = _get(client, f'{job_url}/status')
+        status = json.loads(body)
+        if status['status'] == 'done':
+            break
+        if status['status'] == 'failed':
+            raise BenchError(f"Export {data['kind']} en échec : {status['error']}")
+        if time.monotonic() > deadline:
+            raise BenchError(f"Export {data['kind']} non terminé après {EXPORT_TIMEOUT} s")
+        time.sleep(0.005)
+    response, body = _get(client, status['download_url'])
+    queries = [_query_count(submitted), _query_count(response)]
+    return None if None in queries else sum(queries), len(body)
+
+
+def _request(client, method, url, data):
+    """Appelle une route ; renvoie (requêtes SQL, taille de la réponse)."""
+    if method == 'EXPORT':
+        return _run_export(client, url, data)
+    response, body = _get(client, url)
+    return _query_count(response), len(body)
+
+
+def run_routes(app, iterations=20, warm_cache=False):
+    """Mesure chaque route ; renvoie {nom: {p50_ms, p95_ms, queries, peak_kib}}.
+
+    Sans warm_cache, le cache de requêtes est remplacé par NullCache et les PDF
+    en cache sont supprimés avant chaque appel.
+    """
+    app.config['WTF_CSRF_ENABLED'] = False
+    if not warm_cache:
+        cache.init_app(app, config={'CACHE_TYPE': 'NullCache'})
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    pdf_dir = os.path.join(workdir, 'pdf')
+    app.config['EXPORT_CACHE_DIR'] = pdf_dir
+    app.config['EXPORT_JOBS_DIR'] = os.path.join(workdir, 'jobs')
+
+    def call(method, url, data):
+        if not warm_cache:
+            shutil.rmtree(pdf_dir, ignore_errors=True)
+        return _request(client, method, url, data)
+
+    client = app.test_client()
+    login = client.post('/login', data={'username': ADMIN[0], 'password': ADMIN[1]})
+    if login.status_code != 302:
+        raise BenchError('Connexion du compte de bench impossible.')
+
+    try:
+        return {name: _measure(call, method, url, data, iterations)
+                for name, method, url, data in bench_routes()}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _measure(call, method, url, data, iterations):
+    queries, _size = call(method, url, data)  # préchauffage (gabarits Jinja, imports)
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call(method, url, data)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Mémoire mesurée à part : tracemalloc ralentit les allocations
+    tracemalloc.start()
+    call(method, url, data)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(_percentile(timings, 0.5), 2),
+        'p95_ms': round(_percentile(timings, 0.95), 2),
+        'queries': queries,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Liste des dégradations par rapport à la référence.
+
+    Latence et mémoire peuvent dépasser la référence de `tolerance` (25 %) ;
+    le nombre de requêtes SQL ne doit jamais augmenter.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric in ('p95_ms', 'peak_kib'):
+            if reference.get(metric) and result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(f'{name} : {metric} {result[metric]} > {reference[metric]} (+{tolerance:.0%})')
+        if reference.get('queries') is not None and result['queries'] is not None \
+                and result['queries'] > reference['queries']:
+            regressions.append(f"{name} : {result['queries']} requêtes SQL au lieu de {reference['queries']}")
+    return regressions
+
+
+def format_report(results, baseline=None):
+    baseline = baseline or {}
+    lines = [f"{'route':34} {'p50 ms':>9} {'p95 ms':>9} {'requêtes':>9} {'pic KiB':>10} {'réf p95':>9}"]
+    for name, result in results.items():
+        reference = baseline.get(name, {}).get('p95_ms', '-')
+        lines.append(f"{name:34} {result['p50_ms']:>9} {result['p95_ms']:>9} {str(result['queries']):>9} "
+                     f"{result['peak_kib']:>10} {reference:>9}")
+    return '\n'.join(lines)
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
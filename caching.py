@@ -0,0 +1,150 @@
+"""Cache des résultats de requêtes, invalidé par des générations par table.
+
+Chaque table possède une génération stockée dans le cache. Toute transaction
+qui écrit dans une table en change la génération au commit. Les résultats mis
+en cache sont indexés par les générations des tables dont ils dépendent : une
+écriture les rend donc obsolètes immédiatement, et sans effet sur les autres.
+
+Les générations doivent être partagées par tous les workers, sinon une
+écriture n'invalide le cache que du worker qui l'a faite : le backend par
+défaut est donc FileSystemCache sous instance/cache (un seul serveur), ou
+RedisCache avec CACHE_REDIS_URL (plusieurs serveurs). SimpleCache, propre à
+chaque processus, ne convient qu'avec un seul worker.
+"""
+import functools
+import os
+import threading
+import time
+
+from flask import current_app
+from flask_caching import Cache
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from metrics import record_cache_lookup
+
+cache = Cache()
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def configure_cache(app):
+    """Configure le backend depuis l'environnement : FileSystemCache (défaut), RedisCache ou SimpleCache."""
+    app.config.setdefault('CACHE_TYPE', os.environ.get('CACHE_TYPE', 'FileSystemCache'))
+    app.config.setdefault('CACHE_DEFAULT_TIMEOUT', int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300)))
+    app.config.setdefault('CACHE_KEY_PREFIX', 'crm_')
+    # Nombre d'entrées au-delà duquel FileSystemCache et SimpleCache en suppriment
+    app.config.setdefault('CACHE_THRESHOLD', int(os.environ.get('CACHE_THRESHOLD', 5000)))
+    if os.environ.get('CACHE_DIR'):
+        app.config.setdefault('CACHE_DIR', os.environ['CACHE_DIR'])
+    elif app.config['CACHE_TYPE'] == 'FileSystemCache':
+        app.config.setdefault('CACHE_DIR', os.path.join(app.instance_path, 'cache'))
+    if os.environ.get('CACHE_REDIS_URL'):
+        app.config.setdefault('CACHE_REDIS_URL', os.environ['CACHE_REDIS_URL'])
+    cache.init_app(app)
+
+
+def _generation_key(table):
+    return f'gen:{table}'
+
+
+def generations(tables):
+    """Générations courantes des tables, initialisées si absentes du cache."""
+    keys = [_generation_key(table) for table in tables]
+    values = cache.get_many(*keys)
+    result = []
+    for key, value in zip(keys, values):
+        if value is None:
+            # Une valeur unique plutôt que 0 : après une éviction, on ne retombe
+            # jamais sur une ancienne génération encore associée à des résultats.
+            cache.add(key, time.time_ns(), timeout=0)
+            value = cache.get(key)
+        result.append(value)
+    return result
+
+
+def bump_generations(tables):
+    for table in tables:
+        cache.set(_generation_key(table), time.time_ns(), timeout=0)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    """Compteurs de hits/miss de ce processus."""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'pid': os.getpid(),
+        'backend': current_app.config.get('CACHE_TYPE'),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else None,
+    }
+
+
+def cached_query(*tables, timeout=None):
+    """Mémorise le résultat d'une fonction de requête tant que les tables citées ne changent pas.
+
+    Les arguments de la fonction font partie de la clé : ils doivent avoir un repr stable.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = 'q:{}.{}:{!r}:{!r}:{}'.format(
+                func.__module__, func.__qualname__, args, sorted(kwargs.items()),
+                ':'.join(str(generation) for generation in generations(tables))
+            )
+            value = cache.get(key)
+            record_cache_lookup(value is not None)
+            if value is not None:
+                _count('hits')
+                return value[0]
+            _count('misses')
+            value = func(*args, **kwargs)
+            cache.set(key, (value,), timeout=timeout)
+            return value
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+# Suivi des tables écrites par chaque transaction, pour incrémenter leurs générations au commit
+
+def _touched(session):
+    return session.info.setdefault('touched_tables', set())
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_flush(session, flush_context, instances):
+    touched = _touched(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            touched.add(table.name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _touched(orm_execute_state.session).add(table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_on_commit(session):
+    touched = session.info.pop('touched_tables', None)
+    if touched:
+        bump_generations(touched)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('touched_tables', None)
@@ -0,0 +1,89 @@
+"""Réponses conditionnelles (ETag, Last-Modified, 304).
+
+Données JSON des tableaux de bord : l'ETag est calculé à partir d'une version
+des données et des paramètres, sans exécuter la requête. La version est soit
+lue en base (plus récent updated_at du cumul de chiffre d'affaires), soit
+formée des générations des tables (voir caching.py), partagées par tous les
+workers et incrémentées à chaque écriture : une simple lecture du cache.
+Sans version (NullCache, table vide), la réponse est envoyée sans ETag.
+
+Pages de rapport : ETag et Last-Modified viennent de la date de la dernière
+écriture concernant la page (par exemple le plus récent updated_at de
+monthly_revenue_rollup pour le mois et le projet), lue avant tout calcul.
+Les pages d'un mois clos peuvent être gardées CLOSED_MONTH_MAX_AGE secondes
+par le navigateur (30 jours par défaut).
+"""
+import hashlib
+import os
+from datetime import date
+
+from flask import Response, current_app, jsonify, make_response, request
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+from caching import generations
+
+CLOSED_MONTH_MAX_AGE = 30 * 24 * 3600
+
+
+def table_version(tables):
+    """Version du contenu des tables : leurs générations, ou None si le cache ne les conserve pas."""
+    values = generations(tables)
+    if None in values:
+        return None
+    return ':'.join(str(value) for value in values)
+
+
+def data_etag(version, *parts):
+    """ETag fort : empreinte des paramètres et de la version des données."""
+    key = '|'.join([*map(str, parts), str(version)])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _revalidate(response, etag):
+    response.set_etag(etag)
+    # Le navigateur garde la réponse mais la revalide à chaque affichage
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conditional_json(version, build, *parts):
+    """Réponse JSON de build(), ou 304 si le client détient déjà cette version des données."""
+    if version is None:
+        return jsonify(build())
+    etag = data_etag(version, request.endpoint, *parts)
+    if request.if_none_match.contains(etag):
+        return _revalidate(Response(status=304), etag)
+    return _revalidate(jsonify(build()), etag)
+
+
+def closed_month_max_age(month):
+    """Durée de cache d'une page mensuelle : longue pour un mois écoulé, nulle pour le mois en cours."""
+    if month >= date.today().strftime('%Y-%m'):
+        return 0
+    return int(current_app.config.get(
+        'CLOSED_MONTH_MAX_AGE', os.environ.get('CLOSED_MONTH_MAX_AGE', CLOSED_MONTH_MAX_AGE)
+    ))
+
+
+def conditional_page(last_modified, render, max_age=0):
+    """Page rendue par render(), ou 304 si elle n'a pas changé depuis la version du client.
+
+    last_modified est la date de la dernière écriture dont dépend la page ; à
+    None (aucune donnée), la page est rendue sans en-têtes de validation.
+    """
+    if last_modified is None:
+        return render()
+    # La page dépend aussi de l'utilisateur (menu, rôle)
+    key = '|'.join([request.full_path, str(current_user.get_id()), last_modified.isoformat()])
+    etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(render())
+    else:
+        response = Response(status=304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.vary.add('Cookie')
+    response.headers['Cache-Control'] = f'private, max-age={max_age}' if max_age else 'private, no-cache'
+    return response
@@ -0,0 +1,99 @@
+"""Configuration du moteur de base de données, SQLite ou PostgreSQL.
+
+L'URI vient de DATABASE_URL (SQLite local par défaut). Chaque connexion
+SQLite reçoit les pragmas adaptés à plusieurs workers concurrents (WAL,
+busy_timeout, synchronous=NORMAL, cache et mmap). Pour PostgreSQL, le pool
+de connexions est dimensionné et vérifié (pre-ping, recyclage).
+"""
+import os
+
+from sqlalchemy import String, event, literal
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+DEFAULT_DATABASE_URI = 'sqlite:///plateforme_commerciale.db'
+
+SQLITE_PRAGMAS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT': 5000,        # ms d'attente sur un verrou avant "database is locked"
+    'SQLITE_CACHE_SIZE': -64000,        # négatif : en Kio, soit 64 Mo par connexion
+    'SQLITE_MMAP_SIZE': 268435456,      # 256 Mo
+}
+
+POSTGRES_POOL = {
+    'DB_POOL_SIZE': 5,
+    'DB_MAX_OVERFLOW': 10,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_POOL_TIMEOUT': 30,
+}
+
+
+def database_uri():
+    uri = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URI)
+    # Les hébergeurs fournissent souvent l'ancien schéma postgres://
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def _setting(app, name, default):
+    value = app.config.get(name, os.environ.get(name, default))
+    return type(default)(value)
+
+
+def configure_database(app):
+    """Renseigne l'URI et les options du moteur ; à appeler avant db.init_app(app)."""
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', database_uri())
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+
+    if uri.startswith('postgresql'):
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+            'pool_size': _setting(app, 'DB_POOL_SIZE', POSTGRES_POOL['DB_POOL_SIZE']),
+            'max_overflow': _setting(app, 'DB_MAX_OVERFLOW', POSTGRES_POOL['DB_MAX_OVERFLOW']),
+            'pool_recycle': _setting(app, 'DB_POOL_RECYCLE', POSTGRES_POOL['DB_POOL_RECYCLE']),
+            'pool_timeout': _setting(app, 'DB_POOL_TIMEOUT', POSTGRES_POOL['DB_POOL_TIMEOUT']),
+            'pool_pre_ping': True,
+        })
+
+
+def configure_sqlite_pragmas(app, engine):
+    """Applique les pragmas SQLITE_* à chaque nouvelle connexion du moteur, s'il s'agit de SQLite."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = {name: _setting(app, name, default) for name, default in SQLITE_PRAGMAS.items()}
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={pragmas['SQLITE_JOURNAL_MODE']}")
+        cursor.execute(f"PRAGMA synchronous={pragmas['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA busy_timeout={pragmas['SQLITE_BUSY_TIMEOUT']}")
+        cursor.execute(f"PRAGMA cache_size={pragmas['SQLITE_CACHE_SIZE']}")
+        cursor.execute(f"PRAGMA mmap_size={pragmas['SQLITE_MMAP_SIZE']}")
+        cursor.close()
+
+
+class year_month(FunctionElement):
+    """Mois 'AAAA-MM' d'une colonne de date, quel que soit le moteur.
+
+    Le format est écrit en clair dans le SQL (et non passé en paramètre) pour
+    que la même expression en SELECT et en GROUP BY soit reconnue par PostgreSQL.
+    """
+    type = String()
+    name = 'year_month'
+    inherit_cache = True
+
+
+def _literal(compiler, value, **kw):
+    return compiler.process(literal(value), **dict(kw, literal_binds=True))
+
+
+@compiles(year_month)
+def _year_month_sqlite(element, compiler, **kw):
+    return f"strftime({_literal(compiler, '%Y-%m', **kw)}, {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(year_month, 'postgresql')
+def _year_month_postgresql(element, compiler, **kw):
+    return f"to_char({compiler.process(element.clauses, **kw)}, {_literal(compiler, 'YYYY-MM', **kw)})"
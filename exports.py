@@ -0,0 +1,253 @@
+"""Exports des prospections, générés par lots pour garder une mémoire constante."""
+import glob
+import hashlib
+import os
+import shutil
+import time
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+
+import xlsxwriter
+from flask import current_app
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from sqlalchemy import func
+
+from listings import apply_prospection_filters
+from models import db, Prospection, User
+from plannings import PLANNING_SLOTS
+
+CHUNK_SIZE = 1000
+# Au-delà, le fichier généré passe de la mémoire au disque
+SPOOL_MAX_SIZE = 5 * 1024 * 1024
+
+# Mise en page des rapports PDF : paysage, une ligne de tableau par prospection
+PDF_PAGE_SIZE = landscape(letter)
+PDF_MARGIN = 30
+PDF_FONT = 'Helvetica'
+PDF_FONT_BOLD = 'Helvetica-Bold'
+PDF_FONT_SIZE = 8
+PDF_ROW_HEIGHT = 14
+PDF_COLUMN_WIDTHS = [60, 110, 80, 80, 70, 110, 110, 112]
+# À incrémenter quand la mise en page change, pour invalider les PDF en cache
+PDF_LAYOUT_VERSION = 1
+
+PROSPECTION_COLUMNS = [
+    ('Date', Prospection.date),
+    ('Nom Client', Prospection.nom_client),
+    ('Spécialité', Prospection.specialite),
+    ('Structure', Prospection.structure),
+    ('Téléphone', Prospection.telephone),
+    ('Profils Prospect', Prospection.profils_prospect),
+    ('Produits Présentés', Prospection.produits_presentés),
+    ('Produits Prescrits', Prospection.produits_prescrits),
+]
+COMMERCIAL_COLUMNS = [
+    ('Commercial', User.username),
+    ('Zone', User.zone),
+]
+
+
+def _export_query(columns):
+    return db.session.query(*[column for _header, column in columns]).select_from(Prospection).join(Prospection.commercial)
+
+
+def commercial_export_query(commercial_id):
+    """(colonnes, requête) des prospections d'un commercial, de la plus ancienne à la plus récente."""
+    columns = PROSPECTION_COLUMNS
+    query = _export_query(columns).filter(Prospection.commercial_id == commercial_id)
+    return columns, query.order_by(Prospection.date, Prospection.id)
+
+
+def filtered_export_query(filters, project=None):
+    """(colonnes, requête) des prospections de tous les commerciaux, avec les filtres d'admin_dashboard."""
+    columns = COMMERCIAL_COLUMNS + PROSPECTION_COLUMNS
+    query = apply_prospection_filters(_export_query(columns), filters, project)
+    return columns, query.order_by(Prospection.date, Prospection.id)
+
+
+def iter_rows(query):
+    """Parcourt le résultat par lots de CHUNK_SIZE lignes, sans charger toute la table."""
+    return query.execution_options(stream_results=True).yield_per(CHUNK_SIZE)
+
+
+def write_xlsx(columns, query, sheet_name='Prospections'):
+    """Écrit le résultat dans un classeur Excel et renvoie le fichier, rembobiné.
+
+    xlsxwriter en mode constant_memory écrit chaque ligne dès qu'elle est reçue,
+    et le fichier temporaire ne reste en mémoire que sous SPOOL_MAX_SIZE.
+    """
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({'bold': True})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+
+    for col, (header, _column) in enumerate(columns):
+        worksheet.write_string(0, col, header, header_format)
+    date_col = [header for header, _column in columns].index('Date')
+    worksheet.set_column(date_col, date_col, 12, date_format)
+
+    for row_number, row in enumerate(iter_rows(query), start=1):
+        for col, value in enumerate(row):
+            if col == date_col:
+                worksheet.write_datetime(row_number, col, value, date_format)
+            elif value is not None:
+                # write_string : un texte commençant par '=' ne doit pas devenir une formule
+                worksheet.write_string(row_number, col, str(value))
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def write_roster_xlsx(rosters):
+    """Planning consolidé ({lundi: [RosterRow]}, voir roster.py) : une ligne par semaine et par commercial."""
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Planning')
+    header_format = workbook.add_format({'bold': True})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+
+    headers = ['Semaine du', 'Commercial', 'Zone'] + [slot.replace('_', ' ').title() for slot in PLANNING_SLOTS]
+    for col, header in enumerate(headers):
+        worksheet.write_string(0, col, header, header_format)
+    worksheet.set_column(0, 0, 12, date_format)
+
+    row_number = 1
+    for week in sorted(rosters):
+        for row in rosters[week]:
+            worksheet.write_datetime(row_number, 0, week, date_format)
+            for col, value in enumerate([row.username, row.zone, *row.cells], start=1):
+                if value:
+                    worksheet.write_string(row_number, col, value)
+            row_number += 1
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def _fit(text, width, font=PDF_FONT, size=PDF_FONT_SIZE):
+    """Tronque text pour qu'il tienne dans width points."""
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + '…', font, size) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+def _start_pdf_page(pdf, title, headers, page_number):
+    page_width, page_height = PDF_PAGE_SIZE
+    y = page_height - PDF_MARGIN
+    pdf.setFont(PDF_FONT_BOLD, 12)
+    pdf.drawString(PDF_MARGIN, y - 12, title)
+    pdf.setFont(PDF_FONT, PDF_FONT_SIZE)
+    pdf.drawRightString(page_width - PDF_MARGIN, y - 12, f'Page {page_number}')
+    y -= 12 + PDF_ROW_HEIGHT * 2
+
+    # En-tête du tableau, répété sur chaque page
+    pdf.setFont(PDF_FONT_BOLD, PDF_FONT_SIZE)
+    x = PDF_MARGIN
+    for header, width in zip(headers, PDF_COLUMN_WIDTHS):
+        pdf.drawString(x + 2, y, _fit(header, width - 4, PDF_FONT_BOLD))
+        x += width
+    pdf.line(PDF_MARGIN, y - 4, page_width - PDF_MARGIN, y - 4)
+    pdf.setFont(PDF_FONT, PDF_FONT_SIZE)
+    return y - PDF_ROW_HEIGHT
+
+
+def write_pdf(title, columns, query):
+    """Rapport PDF paginé : les lignes sont lues par lots et dessinées au fil de l'eau."""
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    pdf = canvas.Canvas(output, pagesize=PDF_PAGE_SIZE)
+    headers = [header for header, _column in columns]
+    page_number = 1
+    y = _start_pdf_page(pdf, title, headers, page_number)
+
+    row_count = 0
+    for row in iter_rows(query):
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            page_number += 1
+            y = _start_pdf_page(pdf, title, headers, page_number)
+        x = PDF_MARGIN
+        for value, width in zip(row, PDF_COLUMN_WIDTHS):
+            text = '' if value is None else str(value)
+            pdf.drawString(x + 2, y, _fit(text, width - 4))
+            x += width
+        y -= PDF_ROW_HEIGHT
+        row_count += 1
+
+    if not row_count:
+        pdf.drawString(PDF_MARGIN, y, 'Aucune prospection.')
+    pdf.showPage()
+    pdf.save()
+    output.seek(0)
+    return output
+
+
+def prospections_version(commercial_id):
+    """Version des prospections d'un commercial.
+
+    Le nombre de lignes et le plus grand id changent à chaque ajout ou
+    suppression, le plus récent updated_at à chaque modification.
+    """
+    count, max_id, updated_at = db.session.query(
+        func.count(Prospection.id), func.max(Prospection.id), func.max(Prospection.updated_at)
+    ).filter(Prospection.commercial_id == commercial_id).one()
+    return f"{count}-{max_id or 0}-{updated_at.isoformat() if updated_at else ''}"
+
+
+def _export_cache_dir():
+    path = current_app.config.get('EXPORT_CACHE_DIR') or os.path.join(current_app.instance_path, 'exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def commercial_pdf(commercial):
+    """Chemin du rapport PDF d'un commercial, généré seulement si ses données ont changé.
+
+    Le nom du fichier contient un condensé (commercial, nom et zone affichés,
+    version des prospections, mise en page) : un téléchargement répété réutilise
+    le fichier déjà produit. Les versions précédentes restent sur disque, un
+    autre téléchargement peut être en train de les lire ; sweep_export_cache
+    les supprime plus tard.
+    """
+    key = '|'.join([str(commercial.id), commercial.username, commercial.zone or '',
+                    prospections_version(commercial.id), str(PDF_LAYOUT_VERSION)])
+    digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+    cache_dir = _export_cache_dir()
+    path = os.path.join(cache_dir, f'prospections_{commercial.id}_{digest}.pdf')
+    try:
+        # Date de dernière utilisation, consultée par sweep_export_cache
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+
+    columns, query = commercial_export_query(commercial.id)
+    rendered = write_pdf(f'Prospections de {commercial.username}', columns, query)
+    with NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as tmp:
+        shutil.copyfileobj(rendered, tmp)
+    rendered.close()
+    os.replace(tmp.name, path)
+    return path
+
+
+def sweep_export_cache():
+    """Supprime les PDF en cache inutilisés depuis EXPORT_CACHE_TTL secondes (un jour par défaut)."""
+    ttl = current_app.config.get('EXPORT_CACHE_TTL', 24 * 3600)
+    limit = time.time() - ttl
+    removed = 0
+    cache_dir = _export_cache_dir()
+    for pattern in ('prospections_*.pdf', '*.tmp'):
+        for path in glob.glob(os.path.join(cache_dir, pattern)):
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                # Déjà supprimé par un autre worker
+                pass
+    return removed
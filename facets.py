@@ -0,0 +1,36 @@
+"""Valeurs distinctes (avec effectifs) des listes déroulantes de filtres des tableaux de bord."""
+from sqlalchemy import func
+
+from caching import cached_query
+from models import db, Prospection, User
+
+
+def _count_by(column, project):
+    query = db.session.query(column, func.count()).join(
+        Prospection.commercial
+    ).filter(User.role == 'commercial')
+    if project:
+        query = query.filter(User.project == project)
+    return query.group_by(column).order_by(column).all()
+
+
+def _zone_counts(project):
+    query = db.session.query(User.zone, func.count()).filter(
+        User.role == 'commercial', User.zone.isnot(None)
+    )
+    if project:
+        query = query.filter(User.project == project)
+    return query.group_by(User.zone).order_by(User.zone).all()
+
+
+@cached_query('prospection', 'user')
+def prospection_facets(project=None):
+    """{'specialite': [(valeur, effectif)], 'structure': [...], 'zone': [...]} pour un projet.
+
+    Le résultat reste en cache jusqu'à la prochaine écriture dans prospection ou user.
+    """
+    return {
+        'specialite': [tuple(row) for row in _count_by(Prospection.specialite, project)],
+        'structure': [tuple(row) for row in _count_by(Prospection.structure, project)],
+        'zone': [tuple(row) for row in _zone_counts(project)],
+    }
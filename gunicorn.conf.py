@@ -0,0 +1,31 @@
+# Configuration gunicorn : gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+
+def when_ready(server):
+    # Un cache propre à chaque processus ne reçoit pas les invalidations des autres workers (voir caching.py)
+    if workers > 1 and os.environ.get('CACHE_TYPE') == 'SimpleCache':
+        server.log.warning("CACHE_TYPE=SimpleCache avec %d workers : chaque worker garde son propre cache "
+                           "et sert des résultats périmés après les écritures des autres. "
+                           "Utilisez FileSystemCache (défaut) ou RedisCache.", workers)
+
+
+def post_worker_init(worker):
+    # Exports laissés en cours par un worker arrêté : marqués en échec (voir jobs.py)
+    from app import app
+    from jobs import recover_orphaned_jobs
+    with app.app_context():
+        try:
+            recover_orphaned_jobs()
+        except Exception:
+            # Base pas encore migrée, par exemple : le worker démarre quand même
+            worker.log.exception("Reprise des exports orphelins impossible")
+
+
+def child_exit(server, worker):
+    # Métriques multiprocessus (voir metrics.py) : les jauges d'un worker arrêté ne comptent plus
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,194 @@
+"""File d'attente locale pour les exports Excel/PDF.
+
+Les exports tournent dans un pool de threads, hors du worker qui a reçu la
+requête. Leur état est suivi dans la table export_job, donc visible depuis
+n'importe quel worker. Les fichiers produits restent sur disque
+EXPORT_JOB_TTL secondes après la fin de l'export.
+
+Un export en cours disparaît avec le processus qui le produit (worker
+redémarré ou arrêté) : recover_orphaned_jobs le marque en échec, au démarrage
+de chaque worker (voir gunicorn.conf.py) et à chaque nouvel export. La
+consultation de l'état, interrogée en boucle par la page d'attente, ne fait
+que lire.
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from exports import commercial_export_query, commercial_pdf, filtered_export_query, sweep_export_cache, write_xlsx
+from models import db, ExportJob, User
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ['excel', 'excel_all', 'pdf']
+
+_executor = None
+# Exports confiés au pool de ce processus, oubliés à leur expiration
+_submitted = set()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=current_app.config.get('EXPORT_WORKERS', 2),
+            thread_name_prefix='export'
+        )
+    return _executor
+
+
+def _jobs_dir():
+    path = current_app.config.get('EXPORT_JOBS_DIR') or os.path.join(current_app.instance_path, 'exports', 'jobs')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def submit_export(kind, params, owner):
+    """Enregistre un export et le confie au pool. Renvoie le job créé."""
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Type d'export inconnu : {kind}")
+    recover_orphaned_jobs()
+    evict_expired_jobs()
+
+    job = ExportJob(id=uuid.uuid4().hex, kind=kind, params=json.dumps(params), owner_id=owner.id,
+                    worker=_worker_id())
+    _submitted.add(job.id)
+    db.session.add(job)
+    db.session.commit()
+    _get_executor().submit(_run_job, current_app._get_current_object(), job.id)
+    return job
+
+
+def _render(job, params):
+    """Produit le fichier d'un export. Renvoie (chemin du fichier, nom de téléchargement)."""
+    path = os.path.join(_jobs_dir(), job.id)
+    if job.kind == 'pdf':
+        commercial = User.query.filter_by(username=params['username']).one()
+        shutil.copyfile(commercial_pdf(commercial), path)
+        return path, f"prospections_{commercial.username}.pdf"
+
+    if job.kind == 'excel':
+        commercial = User.query.filter_by(username=params['username']).one()
+        columns, query = commercial_export_query(commercial.id)
+        download_name = f"prospections_{commercial.username}.xlsx"
+    else:
+        columns, query = filtered_export_query(params.get('filters', {}), project=params.get('project'))
+        download_name = 'prospections.xlsx'
+    output = write_xlsx(columns, query)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(output, f)
+    output.close()
+    return path, download_name
+
+
+def _run_job(app, job_id):
+    with app.app_context():
+        job = db.session.get(ExportJob, job_id)
+        job.status = 'running'
+        db.session.commit()
+        try:
+            job.result_path, job.download_name = _render(job, json.loads(job.params))
+            job.status = 'done'
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Échec de l'export {job_id}")
+            job = db.session.get(ExportJob, job_id)
+            job.status = 'failed'
+            job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def _worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _is_orphaned(job_id, worker, host):
+    """Vrai si le processus qui a reçu l'export n'existe plus (vérifiable seulement sur ce serveur)."""
+    worker_host, _sep, pid = (worker or '').rpartition(':')
+    if worker_host != host or not pid.isdigit():
+        return False
+    pid = int(pid)
+    if pid == os.getpid():
+        # Même pid qu'un processus précédent (redémarrage) : l'export n'est pas dans ce pool
+        return job_id not in _submitted
+    if os.name != 'posix':
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def recover_orphaned_jobs():
+    """Marque en échec les exports en attente ou en cours dont le processus a disparu.
+
+    Sur ce serveur, le pid enregistré dans export_job.worker est vérifié ; ailleurs,
+    un export non terminé après EXPORT_JOB_TIMEOUT secondes est considéré perdu.
+    """
+    timeout = current_app.config.get('EXPORT_JOB_TIMEOUT', 1800)
+    limit = datetime.utcnow() - timedelta(seconds=timeout)
+    host = socket.gethostname()
+    unfinished = ExportJob.status.in_(['pending', 'running'])
+    orphaned = [
+        job_id for job_id, worker, created_at in db.session.query(
+            ExportJob.id, ExportJob.worker, ExportJob.created_at
+        ).filter(unfinished)
+        if created_at < limit or _is_orphaned(job_id, worker, host)
+    ]
+    if not orphaned:
+        return 0
+    # Condition répétée dans l'UPDATE : un export terminé entre-temps garde son état
+    count = ExportJob.query.filter(ExportJob.id.in_(orphaned), unfinished).update({
+        'status': 'failed',
+        'error': "Export interrompu : le processus qui le produisait s'est arrêté. Relancez l'export.",
+        'finished_at': datetime.utcnow(),
+    }, synchronize_session=False)
+    db.session.commit()
+    if count:
+        logger.warning(f"{count} export(s) interrompu(s) marqué(s) en échec : {', '.join(orphaned)}")
+    return count
+
+
+def evict_expired_jobs():
+    """Supprime les exports terminés depuis plus de EXPORT_JOB_TTL (et leurs fichiers), et les vieux PDF en cache.
+
+    Un export en attente ou en cours n'est jamais supprimé : son thread écrit
+    encore dans la ligne. S'il est orphelin, recover_orphaned_jobs le marque
+    d'abord en échec.
+    """
+    ttl = current_app.config.get('EXPORT_JOB_TTL', 3600)
+    limit = datetime.utcnow() - timedelta(seconds=ttl)
+    expired = ExportJob.query.filter(
+        ExportJob.status.in_(['done', 'failed']), ExportJob.finished_at < limit
+    ).all()
+    for job in expired:
+        _submitted.discard(job.id)
+        if job.result_path and os.path.exists(job.result_path):
+            os.remove(job.result_path)
+        db.session.delete(job)
+    if expired:
+        db.session.commit()
+    sweep_export_cache()
+    return len(expired)
+
+
+def job_status(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.error,
+    }
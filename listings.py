@@ -0,0 +1,121 @@
+"""Listes de prospections filtrées côté serveur et paginées par curseur (date, id)."""
+from collections import namedtuple
+from datetime import date
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import contains_eager
+
+from caching import cached_query
+from models import db, Prospection, User
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+FILTER_NAMES = ['date_start', 'date_end', 'commercial', 'zone', 'specialite', 'structure']
+
+ProspectionPage = namedtuple('ProspectionPage', ['items', 'next_cursor'])
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def prospection_filters(args):
+    """Extrait les filtres connus des paramètres de la requête, en ignorant les valeurs vides."""
+    return {name: args.get(name) for name in FILTER_NAMES if args.get(name)}
+
+
+def apply_prospection_filters(query, filters, project=None):
+    """Restreint une requête jointe sur Prospection et User aux filtres et au projet."""
+    query = query.filter(User.role == 'commercial')
+    if project:
+        query = query.filter(User.project == project)
+
+    date_start = _parse_date(filters.get('date_start'))
+    date_end = _parse_date(filters.get('date_end'))
+    if date_start:
+        query = query.filter(Prospection.date >= date_start)
+    if date_end:
+        query = query.filter(Prospection.date <= date_end)
+    if filters.get('commercial'):
+        query = query.filter(Prospection.commercial_id == filters['commercial'])
+    if filters.get('zone'):
+        query = query.filter(User.zone == filters['zone'])
+    if filters.get('specialite'):
+        query = query.filter(Prospection.specialite == filters['specialite'])
+    if filters.get('structure'):
+        query = query.filter(Prospection.structure == filters['structure'])
+    return query
+
+
+def filtered_prospections(filters, project=None):
+    """Requête des prospections des commerciaux, restreinte par les filtres et le projet."""
+    query = Prospection.query.join(Prospection.commercial).options(
+        contains_eager(Prospection.commercial)
+    )
+    return apply_prospection_filters(query, filters, project)
+
+
+def encode_cursor(prospection):
+    return f'{prospection.date.isoformat()}_{prospection.id}'
+
+
+def decode_cursor(cursor):
+    """'2024-05-17_1234' -> (date, id), ou None si le curseur est invalide."""
+    try:
+        cursor_date, cursor_id = cursor.split('_')
+        return date.fromisoformat(cursor_date), int(cursor_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def paginate_prospections(query, cursor=None, limit=PAGE_SIZE):
+    """Page de prospections, de la plus récente à la plus ancienne, à partir d'un curseur.
+
+    Le curseur désigne la dernière ligne de la page précédente : la page suivante
+    est obtenue par une recherche d'index sur (date, id) au lieu d'un OFFSET.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        cursor_date, cursor_id = position
+        query = query.filter(or_(
+            Prospection.date < cursor_date,
+            and_(Prospection.date == cursor_date, Prospection.id < cursor_id)
+        ))
+    rows = query.order_by(Prospection.date.desc(), Prospection.id.desc()).limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+    return ProspectionPage(items, next_cursor)
+
+
+def serialize_prospection(prospection):
+    return {
+        'id': prospection.id,
+        'date': prospection.date.isoformat(),
+        'commercial': prospection.commercial.username,
+        'zone': prospection.commercial.zone,
+        'nom_client': prospection.nom_client,
+        'specialite': prospection.specialite,
+        'structure': prospection.structure,
+        'telephone': prospection.telephone,
+        'profils_prospect': prospection.profils_prospect,
+        'produits_presentés': prospection.produits_presentés,
+        'produits_prescrits': prospection.produits_prescrits,
+    }
+
+
+@cached_query('prospection', 'user')
+def top_commerciaux(project=None, limit=5):
+    """Classement des commerciaux par nombre de visites : [(username, zone, nombre_visites)]."""
+    query = db.session.query(
+        User.username,
+        User.zone,
+        func.count(Prospection.id).label('nombre_visites')
+    ).join(Prospection)
+    if project:
+        query = query.filter(User.project == project)
+    return query.group_by(User.id).order_by(func.count(Prospection.id).desc()).limit(limit).all()
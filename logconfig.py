@@ -0,0 +1,129 @@
+"""Journalisation JSON non bloquante.
+
+Les loggers écrivent dans une file (QueueHandler) ; un thread QueueListener
+se charge du formatage JSON et des écritures, hors du thread de la requête.
+Configuration (app.config ou environnement) :
+
+- LOG_LEVEL : niveau du logger racine (INFO par défaut) ;
+- LOG_LEVELS : niveaux par logger, "sqlalchemy.engine=WARNING,jobs=DEBUG" ;
+- LOG_DEBUG_SAMPLE_RATE : fraction des messages DEBUG conservés (0.1) ;
+- LOG_FILE : fichier de sortie, en plus de stderr.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import has_request_context, request, session
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        for field in ('method', 'path', 'endpoint', 'user_id'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Ajoute la requête en cours à l'enregistrement, tant qu'on est dans son thread."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+            record.endpoint = request.endpoint
+            record.user_id = session.get('_user_id')
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Ne garde qu'une fraction des messages DEBUG ; les autres niveaux passent tous."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Le message et l'exception sont figés ici ; le JSON est produit par le listener
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _setting(app, name, default):
+    return app.config.get(name, os.environ.get(name, default))
+
+
+def _parse_levels(levels):
+    if isinstance(levels, dict):
+        return levels
+    result = {}
+    for item in (levels or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            result[name.strip()] = level.strip().upper()
+    return result
+
+
+def configure_logging(app):
+    """Remplace les handlers du logger racine par la file et démarre le listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    formatter = JsonFormatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    log_file = _setting(app, 'LOG_FILE', None)
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(DebugSampler(float(_setting(app, 'LOG_DEBUG_SAMPLE_RATE', 0.1))))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(str(_setting(app, 'LOG_LEVEL', 'INFO')).upper())
+    for name, level in _parse_levels(_setting(app, 'LOG_LEVELS', '')).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
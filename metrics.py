@@ -0,0 +1,150 @@
+"""Métriques Prometheus exposées sur /metrics.
+
+Latence et statut des requêtes par endpoint, attente et durée d'utilisation
+des connexions du pool SQLAlchemy, hits/miss du cache de requêtes et nombre
+d'exports en attente. Hors mode debug, /metrics exige METRICS_TOKEN. Avec plusieurs workers gunicorn, définir
+PROMETHEUS_MULTIPROC_DIR (répertoire vide, partagé par les workers) avant
+le démarrage : chaque worker écrit alors ses valeurs dans des fichiers
+agrégés au moment de la collecte (voir gunicorn.conf.py).
+"""
+import hmac
+import os
+import time
+
+from flask import Response, abort, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event, func
+
+from models import db, ExportJob
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Durée de traitement des requêtes HTTP.',
+    ['endpoint', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUESTS = Counter('http_requests_total', 'Requêtes HTTP par endpoint et statut.', ['endpoint', 'method', 'status'])
+POOL_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', "Attente d'une connexion du pool (ouverture d'une nouvelle connexion comprise).",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 30),
+)
+POOL_HELD = Histogram(
+    'db_pool_connection_held_seconds', 'Durée pendant laquelle une connexion du pool reste empruntée.',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 30),
+)
+POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out_connections', 'Connexions du pool actuellement empruntées.',
+    multiprocess_mode='livesum',
+)
+CACHE_REQUESTS = Counter('query_cache_requests_total', 'Lectures du cache de requêtes, par résultat.', ['result'])
+
+
+class ExportQueueCollector:
+    """Exports en attente ou en cours, lus dans la table export_job au moment de la collecte."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def describe(self):
+        # Rien à décrire à l'enregistrement : la table n'est lue qu'à la collecte
+        return []
+
+    def collect(self):
+        gauge = GaugeMetricFamily('export_jobs', "Exports en file d'attente, par statut.", labels=['status'])
+        with self.app.app_context():
+            counts = dict(db.session.query(ExportJob.status, func.count()).filter(
+                ExportJob.status.in_(['pending', 'running'])
+            ).group_by(ExportJob.status).all())
+            db.session.remove()
+        for status in ('pending', 'running'):
+            gauge.add_metric([status], counts.get(status, 0))
+        yield gauge
+
+
+def record_cache_lookup(hit):
+    CACHE_REQUESTS.labels('hit' if hit else 'miss').inc()
+
+
+def _instrument_pool_wait(pool):
+    """Chronomètre _do_get, l'étape où le pool attend qu'une connexion se libère (ou en ouvre une)."""
+    do_get = pool._do_get
+
+    def _timed_do_get():
+        start = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - start)
+
+    pool._do_get = _timed_do_get
+
+
+def _registry():
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    # Une collecte agrège les fichiers de tous les workers
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def configure_metrics(app):
+    """Mesure les requêtes et le pool, et ajoute la route /metrics.
+
+    /metrics exige l'en-tête « Authorization: Bearer <METRICS_TOKEN> » ; sans
+    METRICS_TOKEN, la route ne répond qu'en mode debug ou de test.
+    """
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+    export_queue = ExportQueueCollector(app)
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        REGISTRY.register(export_queue)
+
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'none'
+            REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - start)
+            REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+        return response
+
+    with app.app_context():
+        engine = db.engine
+    _instrument_pool_wait(engine.pool)
+
+    @event.listens_for(engine, 'engine_disposed')
+    def _on_dispose(engine):
+        # dispose() remplace le pool : le nouveau doit être chronométré aussi
+        _instrument_pool_wait(engine.pool)
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info['checkout_start'] = time.perf_counter()
+        POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        start = connection_record.info.pop('checkout_start', None)
+        if start is not None:
+            POOL_HELD.observe(time.perf_counter() - start)
+            POOL_CHECKED_OUT.dec()
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config['METRICS_TOKEN']
+        if not token:
+            # Métriques (endpoints, volumes) non publiques : jeton obligatoire en production
+            if not (app.debug or app.testing):
+                abort(403)
+        elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+        registry = _registry()
+        if registry is not REGISTRY:
+            registry.register(export_queue)
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
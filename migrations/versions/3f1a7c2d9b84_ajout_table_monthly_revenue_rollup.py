@@ -0,0 +1,55 @@
+"""Ajout de la table monthly_revenue_rollup
+
+Revision ID: 3f1a7c2d9b84
+Revises: 8c995cf635cb
+Create Date: 2025-02-03 10:12:41.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a7c2d9b84'
+down_revision = '8c995cf635cb'
+branch_labels = None
+depends_on = None
+
+SALE_TABLES = {
+    'nova_pharma': 'nova_pharma_sale',
+    'gilbert': 'gilbert_sale',
+    'eric_favre': 'eric_favre_sale',
+    'trois_chene': 'trois_chene_sale',
+}
+
+
+def upgrade():
+    op.create_table('monthly_revenue_rollup',
+    sa.Column('month', sa.String(length=7), nullable=False),
+    sa.Column('lab', sa.String(length=50), nullable=False),
+    sa.Column('project', sa.String(length=50), nullable=False),
+    sa.Column('commercial_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['commercial_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('month', 'lab', 'project', 'commercial_id')
+    )
+
+    # Alimenter l'agrégat avec l'historique des ventes existantes
+    if op.get_bind().dialect.name == 'postgresql':
+        month = "to_char(date, 'YYYY-MM')"
+    else:
+        month = "strftime('%Y-%m', date)"
+    for lab, table in SALE_TABLES.items():
+        op.execute(
+            f"INSERT INTO monthly_revenue_rollup "
+            f"(month, lab, project, commercial_id, quantity, revenue, updated_at) "
+            f"SELECT {month}, '{lab}', project, commercial_id, "
+            f"SUM(quantity), SUM(quantity * price), CURRENT_TIMESTAMP "
+            f"FROM {table} GROUP BY {month}, project, commercial_id"
+        )
+
+
+def downgrade():
+    op.drop_table('monthly_revenue_rollup')
@@ -0,0 +1,88 @@
+"""Ajout de la table planning_slot (demi-journées normalisées des plannings)
+
+Revision ID: 5d9b2e7f1c36
+Revises: c2e5f79a1d48
+Create Date: 2025-02-18 09:42:11.803517
+
+Les douze colonnes texte de planning sont conservées (affichage) ; chaque
+structure qu'elles citent devient une ligne de planning_slot datée du jour
+réel. La reprise lit les plannings par tranches d'ids et découpe les chaînes
+en Python, chaque tranche étant validée à part.
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9b2e7f1c36'
+down_revision = 'c2e5f79a1d48'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 2000
+
+DAYS = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi']
+HALF_DAYS = ['matin', 'soir']
+
+
+def _slot_rows(planning):
+    rows = []
+    for offset, day in enumerate(DAYS):
+        for half_day in HALF_DAYS:
+            structures = []
+            for structure in (planning[f'{day}_{half_day}'] or '').split(','):
+                structure = structure.strip()
+                if structure and structure not in structures:
+                    structures.append(structure)
+            for structure in structures:
+                rows.append({
+                    'planning_id': planning['id'],
+                    'commercial_id': planning['commercial_id'],
+                    'date': planning['date'] + timedelta(days=offset),
+                    'half_day': half_day,
+                    'structure': structure[:50],
+                })
+    return rows
+
+
+def upgrade():
+    planning_slot = op.create_table('planning_slot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('planning_id', sa.Integer(), nullable=False),
+    sa.Column('commercial_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('half_day', sa.String(length=5), nullable=False),
+    sa.Column('structure', sa.String(length=50), nullable=False),
+    sa.ForeignKeyConstraint(['commercial_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['planning_id'], ['planning.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_planning_slot_structure_date', 'planning_slot', ['structure', 'date', 'half_day'], unique=False)
+    op.create_index('ix_planning_slot_date_commercial_id', 'planning_slot', ['date', 'commercial_id'], unique=False)
+    op.create_index('ix_planning_slot_planning_id', 'planning_slot', ['planning_id'], unique=False)
+
+    planning = sa.table('planning', sa.column('id', sa.Integer), sa.column('commercial_id', sa.Integer),
+                        sa.column('date', sa.Date),
+                        *[sa.column(f'{day}_{half_day}', sa.String) for day in DAYS for half_day in HALF_DAYS])
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        last_id = 0
+        while True:
+            plannings = bind.execute(
+                sa.select(planning).where(planning.c.id > last_id).order_by(planning.c.id).limit(BATCH_SIZE)
+            ).mappings().all()
+            if not plannings:
+                break
+            rows = [row for p in plannings for row in _slot_rows(p)]
+            if rows:
+                op.bulk_insert(planning_slot, rows)
+            last_id = plannings[-1]['id']
+
+
+def downgrade():
+    op.drop_index('ix_planning_slot_planning_id', table_name='planning_slot')
+    op.drop_index('ix_planning_slot_date_commercial_id', table_name='planning_slot')
+    op.drop_index('ix_planning_slot_structure_date', table_name='planning_slot')
+    op.drop_table('planning_slot')
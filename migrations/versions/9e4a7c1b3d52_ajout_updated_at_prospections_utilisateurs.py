@@ -0,0 +1,36 @@
+"""Ajout de updated_at sur prospection et user
+
+Revision ID: 9e4a7c1b3d52
+Revises: 5d9b2e7f1c36
+Create Date: 2025-02-20 10:14:36.271905
+
+La date de dernière modification sert de version des données (rapports PDF
+en cache, ETag des graphiques). SQLite refuse d'ajouter une colonne NOT NULL
+avec CURRENT_TIMESTAMP pour défaut : les lignes existantes reçoivent une date
+fixe, que toute modification ultérieure remplace.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4a7c1b3d52'
+down_revision = '5d9b2e7f1c36'
+branch_labels = None
+depends_on = None
+
+EXISTING_ROWS = '1970-01-01 00:00:00'
+
+
+def upgrade():
+    op.add_column('user', sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=EXISTING_ROWS))
+    op.add_column('prospection', sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=EXISTING_ROWS))
+    op.create_index('ix_prospection_updated_at', 'prospection', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_prospection_updated_at', table_name='prospection')
+    with op.batch_alter_table('prospection') as batch_op:
+        batch_op.drop_column('updated_at')
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,74 @@
+"""Ajout du journal des mouvements de stock et de son instantané
+
+Revision ID: a63d0e9c4f17
+Revises: f08a2c5e7b31
+Create Date: 2025-02-14 09:37:52.614820
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a63d0e9c4f17'
+down_revision = 'f08a2c5e7b31'
+branch_labels = None
+depends_on = None
+
+PRODUCT_TABLES = {
+    'nova_pharma': 'nova_pharma_product',
+    'gilbert': 'gilbert_product',
+    'eric_favre': 'eric_favre_product',
+    'trois_chene': 'trois_chene_product',
+}
+DISTRIBUTORS = ['duopharm', 'ubipharm', 'laborex', 'sodipharm']
+
+
+def upgrade():
+    op.create_table('stock_movement',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lab', sa.String(length=50), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('distributor', sa.String(length=20), nullable=False),
+    sa.Column('delta', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('source', sa.String(length=50), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_movement_lab_date', 'stock_movement', ['lab', 'date'], unique=False)
+    op.create_index('ix_stock_movement_lab_product_id_date', 'stock_movement', ['lab', 'product_id', 'date'], unique=False)
+    op.create_table('stock_snapshot',
+    sa.Column('lab', sa.String(length=50), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('distributor', sa.String(length=20), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('last_movement_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('lab', 'product_id', 'distributor')
+    )
+
+    # Les stocks existants deviennent des mouvements d'ouverture, puis l'instantané initial
+    for lab, table in PRODUCT_TABLES.items():
+        for distributor in DISTRIBUTORS:
+            op.execute(
+                f"INSERT INTO stock_movement "
+                f"(lab, product_id, distributor, delta, date, source, created_at) "
+                f"SELECT '{lab}', id, '{distributor}', stock_{distributor}, CURRENT_DATE, "
+                f"'stock_initial', CURRENT_TIMESTAMP "
+                f"FROM {table} WHERE stock_{distributor} <> 0"
+            )
+    op.execute(
+        "INSERT INTO stock_snapshot "
+        "(lab, product_id, distributor, quantity, last_movement_id, updated_at) "
+        "SELECT lab, product_id, distributor, SUM(delta), "
+        "(SELECT MAX(id) FROM stock_movement), CURRENT_TIMESTAMP "
+        "FROM stock_movement GROUP BY lab, product_id, distributor"
+    )
+
+
+def downgrade():
+    op.drop_table('stock_snapshot')
+    op.drop_index('ix_stock_movement_lab_product_id_date', table_name='stock_movement')
+    op.drop_index('ix_stock_movement_lab_date', table_name='stock_movement')
+    op.drop_table('stock_movement')
@@ -0,0 +1,36 @@
+"""Index composites sur les ventes, prospections et plannings
+
+Revision ID: b52e0d4a6c19
+Revises: 3f1a7c2d9b84
+Create Date: 2025-02-05 09:41:17.220463
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52e0d4a6c19'
+down_revision = '3f1a7c2d9b84'
+branch_labels = None
+depends_on = None
+
+SALE_TABLES = ['nova_pharma_sale', 'gilbert_sale', 'eric_favre_sale', 'trois_chene_sale']
+
+
+def upgrade():
+    for table in SALE_TABLES:
+        op.create_index(f'ix_{table}_project_date', table, ['project', 'date'], unique=False)
+        op.create_index(f'ix_{table}_commercial_id_date', table, ['commercial_id', 'date'], unique=False)
+        op.create_index(f'ix_{table}_product_id', table, ['product_id'], unique=False)
+    op.create_index('ix_prospection_commercial_id_date', 'prospection', ['commercial_id', 'date'], unique=False)
+    op.create_index('ix_planning_commercial_id_date', 'planning', ['commercial_id', 'date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_planning_commercial_id_date', table_name='planning')
+    op.drop_index('ix_prospection_commercial_id_date', table_name='prospection')
+    for table in reversed(SALE_TABLES):
+        op.drop_index(f'ix_{table}_product_id', table_name=table)
+        op.drop_index(f'ix_{table}_commercial_id_date', table_name=table)
+        op.drop_index(f'ix_{table}_project_date', table_name=table)
@@ -0,0 +1,25 @@
+"""Ajout de export_job.worker (processus qui exécute l'export)
+
+Revision ID: b7f3d8e2a945
+Revises: 9e4a7c1b3d52
+Create Date: 2025-02-20 15:03:52.448120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7f3d8e2a945'
+down_revision = '9e4a7c1b3d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('export_job', sa.Column('worker', sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('export_job') as batch_op:
+        batch_op.drop_column('worker')
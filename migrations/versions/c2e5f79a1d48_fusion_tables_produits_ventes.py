@@ -0,0 +1,232 @@
+"""Fusion des tables produits / ventes par laboratoire en product et sale
+
+Revision ID: c2e5f79a1d48
+Revises: a63d0e9c4f17
+Create Date: 2025-02-17 11:05:29.470316
+
+Les produits sont recopiés avec un décalage d'identifiant par laboratoire
+(nouvel id = ancien id + décalage), ce qui permet de recopier les ventes et
+de corriger le journal de stock sans table de correspondance. Les ventes sont
+recopiées par tranches de BATCH_SIZE, chaque tranche étant validée à part :
+le verrou d'écriture n'est jamais tenu pendant toute la copie.
+
+La migration peut être relancée après un échec : les tables déjà créées sont
+gardées, les produits d'un laboratoire déjà recopiés ne le sont pas une
+seconde fois (le décalage est alors relu dans product), et la copie des
+ventes reprend après la dernière tranche validée de chaque laboratoire. Le
+dernier ancien id recopié est noté dans sale_copy_progress, dans la même
+transaction que la tranche : les ventes écrites entre-temps par l'application
+dans sale ne faussent pas la reprise. La table est supprimée en fin de copie.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e5f79a1d48'
+down_revision = 'a63d0e9c4f17'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+LAB_TABLES = {
+    'nova_pharma': ('nova_pharma_product', 'nova_pharma_sale'),
+    'gilbert': ('gilbert_product', 'gilbert_sale'),
+    'eric_favre': ('eric_favre_product', 'eric_favre_sale'),
+    'trois_chene': ('trois_chene_product', 'trois_chene_sale'),
+}
+PRODUCT_COLUMNS = 'name, default_price, stock_duopharm, stock_ubipharm, stock_laborex, stock_sodipharm'
+SALE_COLUMNS = 'quantity, price, date, commercial_id, project'
+
+
+def _scalar(sql):
+    return op.get_bind().execute(sa.text(sql)).scalar()
+
+
+def _has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def _reset_sequence(table):
+    # Les ids ont été insérés explicitement : PostgreSQL doit reprendre après le plus grand
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}")
+
+
+def _rebuild_stock_snapshot():
+    # L'instantané est recalculé jusqu'au même mouvement qu'avant la renumérotation
+    watermark = _scalar("SELECT MAX(last_movement_id) FROM stock_snapshot")
+    op.execute("DELETE FROM stock_snapshot")
+    if watermark is not None:
+        op.execute(
+            f"INSERT INTO stock_snapshot "
+            f"(lab, product_id, distributor, quantity, last_movement_id, updated_at) "
+            f"SELECT lab, product_id, distributor, SUM(delta), {watermark}, CURRENT_TIMESTAMP "
+            f"FROM stock_movement WHERE id <= {watermark} GROUP BY lab, product_id, distributor"
+        )
+
+
+def _create_lab_tables(product_table, sale_table):
+    op.create_table(product_table,
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('default_price', sa.Float(), nullable=False),
+    sa.Column('stock_duopharm', sa.Integer(), nullable=False),
+    sa.Column('stock_ubipharm', sa.Integer(), nullable=False),
+    sa.Column('stock_laborex', sa.Integer(), nullable=False),
+    sa.Column('stock_sodipharm', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(sale_table,
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('commercial_id', sa.Integer(), nullable=False),
+    sa.Column('project', sa.String(length=50), nullable=False),
+    sa.ForeignKeyConstraint(['commercial_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], [f'{product_table}.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(f'ix_{sale_table}_project_date', sale_table, ['project', 'date'], unique=False)
+    op.create_index(f'ix_{sale_table}_commercial_id_date', sale_table, ['commercial_id', 'date'], unique=False)
+    op.create_index(f'ix_{sale_table}_product_id', sale_table, ['product_id'], unique=False)
+
+
+def _drop_lab_tables(product_table, sale_table):
+    op.drop_index(f'ix_{sale_table}_product_id', table_name=sale_table)
+    op.drop_index(f'ix_{sale_table}_commercial_id_date', table_name=sale_table)
+    op.drop_index(f'ix_{sale_table}_project_date', table_name=sale_table)
+    op.drop_table(sale_table)
+    op.drop_table(product_table)
+
+
+def _create_tables():
+    op.create_table('product',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lab', sa.String(length=50), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('default_price', sa.Float(), nullable=False),
+    sa.Column('stock_duopharm', sa.Integer(), nullable=False),
+    sa.Column('stock_ubipharm', sa.Integer(), nullable=False),
+    sa.Column('stock_laborex', sa.Integer(), nullable=False),
+    sa.Column('stock_sodipharm', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_product_lab_name', 'product', ['lab', 'name'], unique=False)
+    op.create_table('sale',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lab', sa.String(length=50), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('commercial_id', sa.Integer(), nullable=False),
+    sa.Column('project', sa.String(length=50), nullable=False),
+    sa.ForeignKeyConstraint(['commercial_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sale_lab_date', 'sale', ['lab', 'date'], unique=False)
+    op.create_index('ix_sale_project_date', 'sale', ['project', 'date'], unique=False)
+    op.create_index('ix_sale_commercial_id_date', 'sale', ['commercial_id', 'date'], unique=False)
+    op.create_index('ix_sale_product_id', 'sale', ['product_id'], unique=False)
+
+
+def _create_progress_table():
+    op.create_table('sale_copy_progress',
+    sa.Column('lab', sa.String(length=50), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('lab')
+    )
+
+
+def _copied_until(lab):
+    """Plus grand id de la table de ventes du laboratoire déjà recopié dans sale."""
+    return _scalar(f"SELECT last_id FROM sale_copy_progress WHERE lab = '{lab}'")
+
+
+def upgrade():
+    # Tables déjà présentes : reprise après un échec, product et sale ont été créées ensemble
+    if not _has_table('sale'):
+        _create_tables()
+    if not _has_table('sale_copy_progress'):
+        _create_progress_table()
+
+    # Produits (peu nombreux) et journal de stock, en une transaction
+    remaining = {lab: tables for lab, tables in LAB_TABLES.items() if _has_table(tables[0])}
+    for lab, (product_table, _sale_table) in remaining.items():
+        if _scalar(f"SELECT COUNT(*) FROM product WHERE lab = '{lab}'") \
+                or not _scalar(f"SELECT COUNT(*) FROM {product_table}"):
+            continue
+        offset = _scalar("SELECT COALESCE(MAX(id), 0) FROM product")
+        op.execute(
+            f"INSERT INTO product (id, lab, {PRODUCT_COLUMNS}) "
+            f"SELECT id + {offset}, '{lab}', {PRODUCT_COLUMNS} FROM {product_table}"
+        )
+        op.execute(f"UPDATE stock_movement SET product_id = product_id + {offset} WHERE lab = '{lab}'")
+    for lab in remaining:
+        if _copied_until(lab) is None:
+            op.execute(f"INSERT INTO sale_copy_progress (lab, last_id) VALUES ('{lab}', 0)")
+    _reset_sequence('product')
+    _rebuild_stock_snapshot()
+
+    # Décalages relus dans product, qu'ils viennent de ce passage ou d'un précédent
+    offsets = {
+        lab: _scalar(f"SELECT COALESCE(MIN(id), 0) FROM product WHERE lab = '{lab}'")
+        - _scalar(f"SELECT COALESCE(MIN(id), 0) FROM {product_table}")
+        for lab, (product_table, _sale_table) in remaining.items()
+    }
+
+    # Ventes par tranches d'ids, chacune validée séparément avec sa progression
+    with op.get_context().autocommit_block():
+        for lab, (_product_table, sale_table) in remaining.items():
+            low = _copied_until(lab)
+            while True:
+                high = _scalar(
+                    f"SELECT MAX(id) FROM (SELECT id FROM {sale_table} WHERE id > {low} "
+                    f"ORDER BY id LIMIT {BATCH_SIZE}) AS batch"
+                )
+                if high is None:
+                    break
+                # Tranche et progression validées ensemble
+                op.execute("BEGIN")
+                op.execute(
+                    f"INSERT INTO sale (lab, product_id, {SALE_COLUMNS}) "
+                    f"SELECT '{lab}', product_id + {offsets[lab]}, {SALE_COLUMNS} FROM {sale_table} "
+                    f"WHERE id > {low} AND id <= {high} ORDER BY id"
+                )
+                op.execute(f"UPDATE sale_copy_progress SET last_id = {high} WHERE lab = '{lab}'")
+                op.execute("COMMIT")
+                low = high
+
+    for product_table, sale_table in remaining.values():
+        _drop_lab_tables(product_table, sale_table)
+    op.drop_table('sale_copy_progress')
+
+
+def downgrade():
+    # Les ids de product et sale restent uniques dans chaque table par laboratoire :
+    # ils sont conservés, ainsi que ceux du journal de stock.
+    for lab, (product_table, sale_table) in LAB_TABLES.items():
+        _create_lab_tables(product_table, sale_table)
+        op.execute(
+            f"INSERT INTO {product_table} (id, {PRODUCT_COLUMNS}) "
+            f"SELECT id, {PRODUCT_COLUMNS} FROM product WHERE lab = '{lab}'"
+        )
+        op.execute(
+            f"INSERT INTO {sale_table} (id, product_id, {SALE_COLUMNS}) "
+            f"SELECT id, product_id, {SALE_COLUMNS} FROM sale WHERE lab = '{lab}'"
+        )
+        _reset_sequence(product_table)
+        _reset_sequence(sale_table)
+
+    op.drop_index('ix_sale_product_id', table_name='sale')
+    op.drop_index('ix_sale_commercial_id_date', table_name='sale')
+    op.drop_index('ix_sale_project_date', table_name='sale')
+    op.drop_index('ix_sale_lab_date', table_name='sale')
+    op.drop_table('sale')
+    op.drop_index('ix_product_lab_name', table_name='product')
+    op.drop_table('product')
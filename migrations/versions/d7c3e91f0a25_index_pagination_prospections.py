@@ -0,0 +1,24 @@
+"""Index (date, id) pour la pagination des prospections
+
+Revision ID: d7c3e91f0a25
+Revises: b52e0d4a6c19
+Create Date: 2025-02-07 14:22:05.913870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7c3e91f0a25'
+down_revision = 'b52e0d4a6c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_prospection_date_id', 'prospection', ['date', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_prospection_date_id', table_name='prospection')
@@ -0,0 +1,28 @@
+"""Index pour les facettes spécialité / structure / zone
+
+Revision ID: e41b8f6d2c70
+Revises: d7c3e91f0a25
+Create Date: 2025-02-10 11:05:32.648120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41b8f6d2c70'
+down_revision = 'd7c3e91f0a25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_prospection_specialite', 'prospection', ['specialite', 'commercial_id'], unique=False)
+    op.create_index('ix_prospection_structure', 'prospection', ['structure', 'commercial_id'], unique=False)
+    op.create_index('ix_user_project_role_zone', 'user', ['project', 'role', 'zone'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_project_role_zone', table_name='user')
+    op.drop_index('ix_prospection_structure', table_name='prospection')
+    op.drop_index('ix_prospection_specialite', table_name='prospection')
@@ -0,0 +1,39 @@
+"""Ajout de la table export_job
+
+Revision ID: f08a2c5e7b31
+Revises: e41b8f6d2c70
+Create Date: 2025-02-12 16:48:23.105377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f08a2c5e7b31'
+down_revision = 'e41b8f6d2c70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('export_job',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('params', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('result_path', sa.String(length=500), nullable=True),
+    sa.Column('download_name', sa.String(length=200), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['owner_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_export_job_created_at', 'export_job', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_export_job_created_at', table_name='export_job')
+    op.drop_table('export_job')
@@ -1,3 +1,4 @@
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
@@ -5,14 +6,25 @@ from flask_login import UserMixin
 db = SQLAlchemy()
 
 class User(UserMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_user_project_role_zone', 'project', 'role', 'zone'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(50), nullable=False)
     zone = db.Column(db.String(100), nullable=True)
     project = db.Column(db.String(50), nullable=False)  # 'nasderm' or 'nasmedic'
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Prospection(db.Model):
+    __table_args__ = (
+        db.Index('ix_prospection_commercial_id_date', 'commercial_id', 'date'),
+        db.Index('ix_prospection_date_id', 'date', 'id'),
+        db.Index('ix_prospection_specialite', 'specialite', 'commercial_id'),
+        db.Index('ix_prospection_structure', 'structure', 'commercial_id'),
+        db.Index('ix_prospection_updated_at', 'updated_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     commercial_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
@@ -23,10 +35,14 @@ class Prospection(db.Model):
     profils_prospect = db.Column(db.String(200), nullable=True)
     produits_presentés = db.Column(db.String(200), nullable=True)
     produits_prescrits = db.Column(db.String(200), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     commercial = db.relationship('User', backref='prospections')
     
 class Planning(db.Model):
+    __table_args__ = (
+        db.Index('ix_planning_commercial_id_date', 'commercial_id', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     commercial_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)  # Date de début de la semaine
@@ -47,38 +63,31 @@ class Planning(db.Model):
 
     commercial = db.relationship('User', backref='plannings')
 
-class TroisCheneProduct(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    default_price = db.Column(db.Float, nullable=False)
-    stock_duopharm = db.Column(db.Integer, default=0, nullable=False)
-    stock_ubipharm = db.Column(db.Integer, default=0, nullable=False)
-    stock_laborex = db.Column(db.Integer, default=0, nullable=False)
-    stock_sodipharm = db.Column(db.Integer, default=0, nullable=False)
 
-# Produits Nova Pharma
-class NovaPharmaProduct(db.Model):
+# Une ligne par structure et par demi-journée d'un planning (voir plannings.py).
+# Les colonnes texte de Planning restent la version affichée ; cette table sert
+# aux recherches de couverture ("qui visite tel type de structure, tel jour").
+class PlanningSlot(db.Model):
+    __tablename__ = 'planning_slot'
+    __table_args__ = (
+        db.Index('ix_planning_slot_structure_date', 'structure', 'date', 'half_day'),
+        db.Index('ix_planning_slot_date_commercial_id', 'date', 'commercial_id'),
+        db.Index('ix_planning_slot_planning_id', 'planning_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    default_price = db.Column(db.Float, nullable=False)
-    stock_duopharm = db.Column(db.Integer, default=0, nullable=False)
-    stock_ubipharm = db.Column(db.Integer, default=0, nullable=False)
-    stock_laborex = db.Column(db.Integer, default=0, nullable=False)
-    stock_sodipharm = db.Column(db.Integer, default=0, nullable=False)
-
-# Produits Gilbert
-class GilbertProduct(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    default_price = db.Column(db.Float, nullable=False)
-    stock_duopharm = db.Column(db.Integer, default=0, nullable=False)
-    stock_ubipharm = db.Column(db.Integer, default=0, nullable=False)
-    stock_laborex = db.Column(db.Integer, default=0, nullable=False)
-    stock_sodipharm = db.Column(db.Integer, default=0, nullable=False)
+    planning_id = db.Column(db.Integer, db.ForeignKey('planning.id', ondelete='CASCADE'), nullable=False)
+    commercial_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)  # Jour de la demi-journée (début de semaine + n jours)
+    half_day = db.Column(db.String(5), nullable=False)  # 'matin' ou 'soir'
+    structure = db.Column(db.String(50), nullable=False)  # Valeur de PlanningForm.STRUCTURES
 
-# Produits Eric Favre
-class EricFavreProduct(db.Model):
+# Produits de tous les laboratoires ; lab reprend une clé de revenue.LABS
+class Product(db.Model):
+    __table_args__ = (
+        db.Index('ix_product_lab_name', 'lab', 'name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
+    lab = db.Column(db.String(50), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     default_price = db.Column(db.Float, nullable=False)
     stock_duopharm = db.Column(db.Integer, default=0, nullable=False)
@@ -86,43 +95,79 @@ class EricFavreProduct(db.Model):
     stock_laborex = db.Column(db.Integer, default=0, nullable=False)
     stock_sodipharm = db.Column(db.Integer, default=0, nullable=False)
 
-
-class EricFavreSale(db.Model):
-    __tablename__ = 'eric_favre_sale'
+# Ventes de tous les laboratoires. lab est recopié du produit pour que les
+# requêtes de chiffre d'affaire filtrent directement sur l'index (lab, date).
+class Sale(db.Model):
+    __table_args__ = (
+        db.Index('ix_sale_lab_date', 'lab', 'date'),
+        db.Index('ix_sale_project_date', 'project', 'date'),
+        db.Index('ix_sale_commercial_id_date', 'commercial_id', 'date'),
+        db.Index('ix_sale_product_id', 'product_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('eric_favre_product.id'), nullable=False)
+    lab = db.Column(db.String(50), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     date = db.Column(db.Date, nullable=False)
     commercial_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    project = db.Column(db.String(50), nullable=False, default='nasmedic')  # Ajoutez ce champ
-    
-class TroisCheneSale(db.Model):
-    __tablename__ = 'trois_chene_sale'
-    id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('trois_chene_product.id'), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    date = db.Column(db.Date, nullable=False)
-    commercial_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    project = db.Column(db.String(50), nullable=False, default='nasmedic')  # Ajoutez ce champ
+    project = db.Column(db.String(50), nullable=False)
 
-class NovaPharmaSale(db.Model):
-    __tablename__ = 'nova_pharma_sale'
-    id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('nova_pharma_product.id'), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    date = db.Column(db.Date, nullable=False)
-    commercial_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    project = db.Column(db.String(50), nullable=False, default='nasderm')  # Ajoutez ce champ
 
-class GilbertSale(db.Model):
-    __tablename__ = 'gilbert_sale'
+# Chiffre d'affaire agrégé par mois, laboratoire, projet et commercial.
+# Alimenté dans la même transaction que la saisie des ventes (voir revenue.py).
+class MonthlyRevenueRollup(db.Model):
+    __tablename__ = 'monthly_revenue_rollup'
+    month = db.Column(db.String(7), primary_key=True)  # 'AAAA-MM'
+    lab = db.Column(db.String(50), primary_key=True)
+    project = db.Column(db.String(50), primary_key=True)
+    commercial_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Exports Excel/PDF exécutés en arrière-plan (voir jobs.py)
+class ExportJob(db.Model):
+    __tablename__ = 'export_job'
+    __table_args__ = (
+        db.Index('ix_export_job_created_at', 'created_at'),
+    )
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'excel', 'excel_all' ou 'pdf'
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    result_path = db.Column(db.String(500), nullable=True)
+    download_name = db.Column(db.String(200), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)  # 'hôte:pid' du processus qui exécute l'export
+
+
+# Journal des mouvements de stock, en ajout seul (voir stock.py).
+class StockMovement(db.Model):
+    __tablename__ = 'stock_movement'
+    __table_args__ = (
+        db.Index('ix_stock_movement_lab_date', 'lab', 'date'),
+        db.Index('ix_stock_movement_lab_product_id_date', 'lab', 'product_id', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('gilbert_product.id'), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    lab = db.Column(db.String(50), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    distributor = db.Column(db.String(20), nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
     date = db.Column(db.Date, nullable=False)
-    commercial_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    project = db.Column(db.String(50), nullable=False, default='nasderm')  # Ajoutez ce champ
+    source = db.Column(db.String(50), nullable=False)  # 'saisie_ventes', 'stock_initial', ...
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# Stock cumulé par produit et distributeur, jusqu'au mouvement last_movement_id inclus
+class StockSnapshot(db.Model):
+    __tablename__ = 'stock_snapshot'
+    lab = db.Column(db.String(50), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    distributor = db.Column(db.String(20), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    last_movement_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,55 @@
+"""Conversion des périodes (mois, semaine, trimestre) en intervalles de dates semi-ouverts.
+
+Filtrer sur `date >= début AND date < fin` permet à la base d'utiliser les index
+sur les colonnes de date, contrairement à `strftime('%Y-%m', date) == mois`.
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import and_
+
+
+def month_range(month):
+    """'2024-02' -> (2024-02-01, 2024-03-01)."""
+    year, month_number = (int(part) for part in month.split('-'))
+    start = date(year, month_number, 1)
+    if month_number == 12:
+        return start, date(year + 1, 1, 1)
+    return start, date(year, month_number + 1, 1)
+
+
+def week_range(week):
+    """Semaine ISO '2024-W05' -> (lundi, lundi suivant)."""
+    year, week_number = week.upper().split('-W')
+    start = date.fromisocalendar(int(year), int(week_number), 1)
+    return start, start + timedelta(days=7)
+
+
+def quarter_range(quarter):
+    """'2024-Q1' -> (2024-01-01, 2024-04-01)."""
+    year, quarter_number = quarter.upper().split('-Q')
+    quarter_number = int(quarter_number)
+    if not 1 <= quarter_number <= 4:
+        raise ValueError(f'Trimestre invalide : {quarter}')
+    start = date(int(year), 3 * quarter_number - 2, 1)
+    if quarter_number == 4:
+        return start, date(int(year) + 1, 1, 1)
+    return start, date(int(year), 3 * quarter_number + 1, 1)
+
+
+PERIODS = {
+    'month': month_range,
+    'week': week_range,
+    'quarter': quarter_range,
+}
+
+
+def period_range(kind, value):
+    """Intervalle [début, fin[ d'une période. Lève ValueError si la période est invalide."""
+    if kind not in PERIODS:
+        raise ValueError(f'Type de période inconnu : {kind}')
+    return PERIODS[kind](value)
+
+
+def in_range(column, start, end):
+    """Condition SQL `start <= column < end`, utilisable par un index sur column."""
+    return and_(column >= start, column < end)
@@ -0,0 +1,89 @@
+"""Demi-journées des plannings, normalisées dans la table planning_slot.
+
+Un planning est enregistré deux fois dans la même transaction : dans les
+douze colonnes texte de Planning ("HOPITAL, CLINIQUE"), affichées telles
+quelles, et sous forme d'une ligne PlanningSlot par structure et par
+demi-journée, datée du jour réel (début de semaine + n jours). Une question
+de couverture ("qui visite un HOPITAL mardi matin ?") est alors une seule
+requête sur l'index (structure, date, half_day), sans découpage de chaînes.
+"""
+from datetime import timedelta
+
+from sqlalchemy import insert
+
+from models import db, Planning, PlanningSlot, User
+from periods import in_range
+
+# Demi-journées d'un planning, dans l'ordre des colonnes de Planning (lundi_matin...)
+PLANNING_DAYS = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi']
+PLANNING_HALF_DAYS = ['matin', 'soir']
+PLANNING_SLOTS = [f'{day}_{half_day}' for day in PLANNING_DAYS for half_day in PLANNING_HALF_DAYS]
+
+
+def split_structures(value):
+    """'HOPITAL, CLINIQUE' -> ['HOPITAL', 'CLINIQUE'], sans vides ni doublons."""
+    structures = []
+    for structure in (value or '').split(','):
+        structure = structure.strip()
+        if structure and structure not in structures:
+            structures.append(structure)
+    return structures
+
+
+def planning_slots(planning_id, commercial_id, week_start, slots):
+    """Lignes planning_slot d'un planning ; slots associe 'lundi_matin'... à une liste de structures."""
+    rows = []
+    for offset, day in enumerate(PLANNING_DAYS):
+        for half_day in PLANNING_HALF_DAYS:
+            for structure in slots.get(f'{day}_{half_day}', []):
+                rows.append({
+                    'planning_id': planning_id,
+                    'commercial_id': commercial_id,
+                    'date': week_start + timedelta(days=offset),
+                    'half_day': half_day,
+                    'structure': structure,
+                })
+    return rows
+
+
+def save_planning(commercial_id, week_start, slots):
+    """Enregistre un planning et ses demi-journées dans une seule transaction ; renvoie le Planning."""
+    slots = {slot: split_structures(', '.join(structures)) for slot, structures in slots.items()}
+    planning = Planning(
+        commercial_id=commercial_id,
+        date=week_start,
+        **{slot: ', '.join(structures) for slot, structures in slots.items()},
+    )
+    try:
+        db.session.add(planning)
+        db.session.flush()
+        rows = planning_slots(planning.id, commercial_id, week_start, slots)
+        if rows:
+            db.session.execute(insert(PlanningSlot), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return planning
+
+
+def planning_coverage(start, end, structure=None, half_day=None, project=None):
+    """Demi-journées planifiées sur [start, end[ par tous les commerciaux, en une requête.
+
+    Renvoie des lignes (date, half_day, structure, commercial_id, username, zone)
+    triées par date, demi-journée, structure et commercial.
+    """
+    query = db.session.query(
+        PlanningSlot.date, PlanningSlot.half_day, PlanningSlot.structure,
+        User.id.label('commercial_id'), User.username, User.zone,
+    ).join(User, User.id == PlanningSlot.commercial_id).filter(in_range(PlanningSlot.date, start, end))
+    if structure:
+        query = query.filter(PlanningSlot.structure == structure)
+    if half_day:
+        query = query.filter(PlanningSlot.half_day == half_day)
+    if project:
+        query = query.filter(User.project == project)
+    # Un planning ressaisi pour la même semaine ne compte qu'une fois
+    return query.distinct().order_by(
+        PlanningSlot.date, PlanningSlot.half_day, PlanningSlot.structure, User.username
+    ).all()
@@ -0,0 +1,46 @@
+"""Requêtes en lecture seule des pages de liste.
+
+Elles ne sélectionnent que les colonnes affichées et renvoient des lignes
+(accessibles par attribut, comme des namedtuples) au lieu d'objets ORM : rien
+n'entre dans l'identity map de la session et aucune relation n'est chargée
+paresseusement depuis les templates.
+"""
+from models import db, Planning, Prospection, User
+from plannings import PLANNING_SLOTS
+
+PROSPECTION_COLUMNS = [
+    Prospection.id, Prospection.date, Prospection.nom_client, Prospection.specialite,
+    Prospection.structure, Prospection.telephone, Prospection.profils_prospect,
+    Prospection.produits_presentés, Prospection.produits_prescrits,
+]
+
+
+def commercial_options(project=None):
+    """(id, username, zone) des commerciaux, pour les listes déroulantes et les liens."""
+    query = db.session.query(User.id, User.username, User.zone).filter(User.role == 'commercial')
+    if project:
+        query = query.filter(User.project == project)
+    return query.order_by(User.username).all()
+
+
+def commercial_by_username(username):
+    return db.session.query(User.id, User.username).filter(User.username == username).first()
+
+
+def commercial_by_id(commercial_id):
+    return db.session.query(User.id, User.username).filter(User.id == commercial_id).first()
+
+
+def commercial_prospection_rows(commercial_id):
+    """Prospections d'un commercial, les plus récentes d'abord (index commercial_id, date)."""
+    return db.session.query(*PROSPECTION_COLUMNS).filter(
+        Prospection.commercial_id == commercial_id
+    ).order_by(Prospection.date.desc(), Prospection.id.desc()).all()
+
+
+def planning_rows(commercial_id):
+    """Plannings d'un commercial (date et demi-journées), les plus récents d'abord."""
+    columns = [Planning.id, Planning.date] + [getattr(Planning, slot) for slot in PLANNING_SLOTS]
+    return db.session.query(*columns).filter(
+        Planning.commercial_id == commercial_id
+    ).order_by(Planning.date.desc(), Planning.id.desc()).all()
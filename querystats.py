@@ -0,0 +1,133 @@
+"""Comptage des requêtes SQL par requête HTTP et détection des N+1.
+
+Les événements du moteur SQLAlchemy comptent, pour chaque requête HTTP, le
+nombre de requêtes SQL, le temps passé en base et le nombre d'exécutions de
+chaque instruction (à paramètres près). Une instruction répétée au moins
+SQL_N_PLUS_ONE_THRESHOLD fois est signalée comme N+1 probable. Les
+administrateurs reçoivent le résumé dans l'en-tête X-SQL-Stats, et un
+rapport glissant par endpoint est tenu en mémoire de chaque processus.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_reports = {}
+_reports_lock = threading.Lock()
+
+# Listes de paramètres de longueur variable : IN (?, ?, ?) et VALUES (?, ?), (?, ?)
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|:\w+)\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """Instruction SQL normalisée : espaces et listes de paramètres réduits."""
+    return _IN_LIST.sub('(?)', _SPACES.sub(' ', statement).strip())
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+
+    def repeated(self, threshold):
+        """Instructions exécutées au moins threshold fois, les plus fréquentes d'abord."""
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+def _current_stats():
+    if has_request_context():
+        return g.get('sql_stats')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    starts = conn.info.get('query_start')
+    if stats is None or not starts:
+        return
+    stats.db_time += time.perf_counter() - starts.pop()
+    stats.queries += 1
+    stats.statements[fingerprint(statement)] += 1
+
+
+def configure_query_stats(app):
+    """Active le comptage pour l'application ; SQL_STATS=0 le désactive."""
+    app.config.setdefault('SQL_STATS', os.environ.get('SQL_STATS', '1') != '0')
+    app.config.setdefault('SQL_N_PLUS_ONE_THRESHOLD', int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5)))
+    app.config.setdefault('SQL_STATS_WINDOW', int(os.environ.get('SQL_STATS_WINDOW', 200)))
+    if not app.config['SQL_STATS']:
+        return
+
+    @app.before_request
+    def _start_query_stats():
+        g.sql_stats = RequestStats()
+
+    @app.after_request
+    def _finish_query_stats(response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        threshold = app.config['SQL_N_PLUS_ONE_THRESHOLD']
+        repeated = stats.repeated(threshold)
+        endpoint = request.endpoint or request.path
+        for sql, count in repeated:
+            logger.warning(f"N+1 probable sur {endpoint} : {count} exécutions de {sql[:200]}")
+        _record(endpoint, stats, repeated, app.config['SQL_STATS_WINDOW'])
+
+        if current_user.is_authenticated and current_user.role == 'admin':
+            response.headers['X-SQL-Stats'] = (
+                f"queries={stats.queries}; db_time_ms={stats.db_time * 1000:.1f}; repeated={len(repeated)}"
+            )
+        return response
+
+
+def _record(endpoint, stats, repeated, window):
+    with _reports_lock:
+        samples = _reports.setdefault(endpoint, deque(maxlen=window))
+        samples.append((stats.queries, stats.db_time, tuple(sql for sql, _count in repeated)))
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def query_stats_report():
+    """Rapport par endpoint sur les dernières requêtes de ce processus."""
+    with _reports_lock:
+        snapshot = {endpoint: list(samples) for endpoint, samples in _reports.items()}
+
+    endpoints = {}
+    for endpoint, samples in sorted(snapshot.items()):
+        queries = [sample[0] for sample in samples]
+        times = [sample[1] * 1000 for sample in samples]
+        flagged = Counter(sql for sample in samples for sql in sample[2])
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'queries_avg': sum(queries) / len(queries),
+            'queries_max': max(queries),
+            'db_time_ms_avg': sum(times) / len(times),
+            'db_time_ms_p95': _percentile(times, 0.95),
+            'n_plus_one': [{'statement': sql, 'requests': count} for sql, count in flagged.most_common(10)],
+        }
+    return {'pid': os.getpid(), 'endpoints': endpoints}
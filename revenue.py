@@ -0,0 +1,189 @@
+"""Agrégation du chiffre d'affaire mensuel pour l'ensemble des laboratoires."""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, delete, func, insert, literal, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from caching import cached_query
+from database import year_month
+from periods import in_range
+from models import db, MonthlyRevenueRollup, Product, Sale
+
+Lab = namedtuple('Lab', ['key', 'name', 'project'])
+
+# Laboratoires connus, avec le projet auquel leurs ventes sont rattachées par défaut.
+# Produits et ventes de tous les laboratoires partagent les tables product et sale :
+# un nouveau laboratoire ne demande qu'une entrée ici.
+LABS = {
+    'nova_pharma': Lab('nova_pharma', 'Nova Pharma', 'nasderm'),
+    'gilbert': Lab('gilbert', 'Gilbert', 'nasderm'),
+    'eric_favre': Lab('eric_favre', 'Eric Favre', 'nasmedic'),
+    'trois_chene': Lab('trois_chene', '3 Chênes Pharma', 'nasmedic'),
+}
+
+# Sélections (laboratoire, projet) utilisées par les pages de chiffre d'affaire.
+# Un projet à None signifie "toutes les ventes du laboratoire".
+ALL_LABS = [(key, None) for key in LABS]
+NASDERM_LABS = [('nova_pharma', 'nasderm'), ('gilbert', 'nasderm')]
+NASMEDIC_LABS = [('eric_favre', 'nasmedic'), ('trois_chene', 'nasmedic')]
+# Page de chiffre d'affaire mensuel : Nova Pharma, Gilbert, 3 Chênes Pharma
+MONTHLY_REVENUE_LABS = [('nova_pharma', 'nasderm'), ('gilbert', 'nasderm'), ('trois_chene', 'nasmedic')]
+
+# Courbe de chiffre d'affaire de chaque tableau de bord
+DASHBOARD_LABS = {
+    'nasmedic': [('eric_favre', 'nasmedic')],
+    'nasderm': [('nova_pharma', 'nasderm')],
+    'all': ALL_LABS,
+}
+
+
+def month_bucket(column):
+    return year_month(column)
+
+
+def _lab_conditions(model, labs):
+    """Filtre (laboratoire, projet) ; un projet à None couvre toutes les ventes du laboratoire."""
+    return or_(*[
+        and_(model.lab == key, model.project == project) if project else model.lab == key
+        for key, project in labs
+    ])
+
+
+def sales_revenue_select(labs):
+    """Chiffre d'affaire par (mois, laboratoire, projet, commercial), calculé sur les ventes brutes en un seul parcours."""
+    month = month_bucket(Sale.date)
+    return select(
+        month.label('month'),
+        Sale.lab.label('lab'),
+        Sale.project.label('project'),
+        Sale.commercial_id.label('commercial_id'),
+        func.sum(Sale.quantity).label('quantity'),
+        func.sum(Sale.quantity * Sale.price).label('revenue')
+    ).where(_lab_conditions(Sale, labs)).group_by(month, Sale.lab, Sale.project, Sale.commercial_id)
+
+
+def monthly_revenue_rows(labs):
+    """Chiffre d'affaire par (mois, laboratoire, projet), lu dans la table monthly_revenue_rollup."""
+    if not labs:
+        return []
+    Rollup = MonthlyRevenueRollup
+    stmt = select(
+        Rollup.month, Rollup.lab, Rollup.project, func.sum(Rollup.revenue)
+    ).where(_lab_conditions(Rollup, labs)).group_by(Rollup.month, Rollup.lab, Rollup.project)
+    return db.session.execute(stmt).all()
+
+
+def revenue_last_modified(labs, month=None):
+    """Dernière écriture dans monthly_revenue_rollup pour ces laboratoires, sur un mois ou sur tous."""
+    Rollup = MonthlyRevenueRollup
+    stmt = select(func.max(Rollup.updated_at)).where(_lab_conditions(Rollup, labs))
+    if month:
+        stmt = stmt.where(Rollup.month == month)
+    return db.session.execute(stmt).scalar()
+
+
+def _upsert(values):
+    dialect = db.session.get_bind().dialect.name
+    insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    stmt = insert_(MonthlyRevenueRollup).values(values)
+    return stmt.on_conflict_do_update(
+        index_elements=['month', 'lab', 'project', 'commercial_id'],
+        set_={
+            'quantity': MonthlyRevenueRollup.quantity + stmt.excluded.quantity,
+            'revenue': MonthlyRevenueRollup.revenue + stmt.excluded.revenue,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    )
+
+
+def record_sales(lab_key, sales):
+    """Reporte des ventes (dictionnaires date, project, commercial_id, quantity, price) dans monthly_revenue_rollup.
+
+    S'exécute dans la transaction de la session : l'appelant commit les ventes
+    et l'agrégat ensemble.
+    """
+    deltas = {}
+    for sale in sales:
+        key = (sale['date'].strftime('%Y-%m'), lab_key, sale['project'], sale['commercial_id'])
+        quantity, revenue = deltas.get(key, (0, 0))
+        deltas[key] = (quantity + sale['quantity'], revenue + sale['quantity'] * sale['price'])
+    if not deltas:
+        return
+
+    now = datetime.utcnow()
+    values = [
+        {'month': month, 'lab': lab, 'project': project, 'commercial_id': commercial_id,
+         'quantity': quantity, 'revenue': revenue, 'updated_at': now}
+        for (month, lab, project, commercial_id), (quantity, revenue) in deltas.items()
+    ]
+    db.session.execute(_upsert(values))
+
+
+def rebuild_revenue_rollup():
+    """Recalcule entièrement monthly_revenue_rollup à partir des ventes brutes."""
+    sales = sales_revenue_select(ALL_LABS).subquery()
+    db.session.execute(delete(MonthlyRevenueRollup))
+    db.session.execute(insert(MonthlyRevenueRollup).from_select(
+        ['month', 'lab', 'project', 'commercial_id', 'quantity', 'revenue', 'updated_at'],
+        select(sales.c.month, sales.c.lab, sales.c.project, sales.c.commercial_id,
+               sales.c.quantity, sales.c.revenue, literal(datetime.utcnow()))
+    ))
+    db.session.commit()
+    return db.session.query(func.count()).select_from(MonthlyRevenueRollup).scalar()
+
+
+@cached_query('sale', 'product')
+def product_revenue(lab_key, start, end, project=None):
+    """Quantité et chiffre d'affaire par produit d'un laboratoire sur [start, end[."""
+    query = db.session.query(
+        Product.name,
+        func.sum(Sale.quantity).label('total_quantity'),
+        func.sum(Sale.quantity * Sale.price).label('total_revenue')
+    ).join(Sale).filter(Sale.lab == lab_key, in_range(Sale.date, start, end))
+    if project:
+        query = query.filter(Sale.project == project)
+    return query.group_by(Product.name).all()
+
+
+def iter_months(first, last):
+    """Itère sur les mois 'AAAA-MM' de first à last inclus."""
+    year, month = map(int, first.split('-'))
+    while f'{year:04d}-{month:02d}' <= last:
+        yield f'{year:04d}-{month:02d}'
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+def pivot_monthly_revenue(rows, keys):
+    """Transforme des lignes (mois, labo, projet, CA) en tableau trié et complété par des zéros.
+
+    Chaque ligne du résultat vaut (mois, CA labo 1, ..., CA labo n, total).
+    """
+    by_month = {}
+    for month, lab, _project, revenue in rows:
+        if lab not in keys:
+            continue
+        by_month.setdefault(month, dict.fromkeys(keys, 0))[lab] += revenue or 0
+    if not by_month:
+        return []
+
+    table = []
+    for month in iter_months(min(by_month), max(by_month)):
+        revenues = by_month.get(month, {})
+        values = [revenues.get(key, 0) for key in keys]
+        table.append((month, *values, sum(values)))
+    return table
+
+
+@cached_query('monthly_revenue_rollup')
+def monthly_revenue_table(labs):
+    keys = [key for key, _project in labs]
+    return pivot_monthly_revenue(monthly_revenue_rows(labs), keys)
+
+
+def monthly_revenue_series(labs):
+    """Labels et totaux mensuels prêts pour un graphique."""
+    table = monthly_revenue_table(labs)
+    return [row[0] for row in table], [row[-1] for row in table]
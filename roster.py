@@ -0,0 +1,97 @@
+"""Planning hebdomadaire consolidé de tous les commerciaux.
+
+Pour chaque semaine, une ligne par commercial et une colonne par demi-journée
+(lundi matin ... samedi soir), construites à partir de planning_slot. Toutes
+les semaines demandées sont lues en une seule requête ; chaque semaine est
+ensuite mise en cache séparément, tant que planning_slot et user ne changent
+pas, si bien qu'une plage qui chevauche une plage déjà consultée ne relit que
+les semaines manquantes.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from sqlalchemy import and_
+
+from caching import cache, generations
+from metrics import record_cache_lookup
+from models import db, PlanningSlot, User
+from periods import in_range, week_range
+from plannings import PLANNING_DAYS, PLANNING_HALF_DAYS, PLANNING_SLOTS
+
+MAX_WEEKS = 12
+
+RosterRow = namedtuple('RosterRow', ['commercial_id', 'username', 'zone', 'cells'])
+
+
+def roster_weeks(first_week, last_week=None):
+    """Lundis des semaines ISO '2024-W05' à last_week incluse. Lève ValueError si la plage est invalide."""
+    start, _end = week_range(first_week)
+    last, _end = week_range(last_week or first_week)
+    if last < start:
+        raise ValueError('La semaine de fin précède la semaine de début')
+    weeks = [start + timedelta(weeks=n) for n in range((last - start).days // 7 + 1)]
+    if len(weeks) > MAX_WEEKS:
+        raise ValueError(f'Au plus {MAX_WEEKS} semaines à la fois')
+    return weeks
+
+
+def _slot_index(slot_date, half_day):
+    weekday = slot_date.weekday()
+    if weekday >= len(PLANNING_DAYS):
+        # Dimanche : un planning commencé en milieu de semaine peut y déborder
+        return None
+    return weekday * len(PLANNING_HALF_DAYS) + PLANNING_HALF_DAYS.index(half_day)
+
+
+def load_rosters(weeks, project=None):
+    """{lundi: [RosterRow]} des semaines données, en une requête (jointure externe : tous les commerciaux)."""
+    start, end = min(weeks), max(weeks) + timedelta(weeks=1)
+    query = db.session.query(
+        User.id, User.username, User.zone, PlanningSlot.date, PlanningSlot.half_day, PlanningSlot.structure
+    ).outerjoin(PlanningSlot, and_(
+        PlanningSlot.commercial_id == User.id, in_range(PlanningSlot.date, start, end)
+    )).filter(User.role == 'commercial')
+    if project:
+        query = query.filter(User.project == project)
+    rows = query.order_by(User.username, User.id, PlanningSlot.date, PlanningSlot.half_day,
+                          PlanningSlot.structure).all()
+
+    commerciaux = {}
+    grids = {week: {} for week in weeks}
+    for commercial_id, username, zone, slot_date, half_day, structure in rows:
+        commerciaux.setdefault(commercial_id, (username, zone))
+        if slot_date is None:
+            continue
+        week = slot_date - timedelta(days=slot_date.weekday())
+        index = _slot_index(slot_date, half_day)
+        if week not in grids or index is None:
+            continue
+        cells = grids[week].setdefault(commercial_id, [[] for _slot in PLANNING_SLOTS])
+        # Deux plannings saisis pour la même semaine : chaque structure n'apparaît qu'une fois
+        if structure not in cells[index]:
+            cells[index].append(structure)
+
+    return {
+        week: [
+            RosterRow(commercial_id, username, zone, tuple(', '.join(cell) for cell in grid.get(
+                commercial_id, [[] for _slot in PLANNING_SLOTS]
+            )))
+            for commercial_id, (username, zone) in commerciaux.items()
+        ]
+        for week, grid in grids.items()
+    }
+
+
+def weekly_rosters(weeks, project=None):
+    """Comme load_rosters, avec un cache par semaine ; seules les semaines absentes du cache sont lues."""
+    version = ':'.join(str(generation) for generation in generations(['planning_slot', 'user']))
+    keys = {week: f'roster:{project}:{week.isoformat()}:{version}' for week in weeks}
+    rosters = dict(zip(weeks, cache.get_many(*keys.values())))
+    missing = [week for week, roster in rosters.items() if roster is None]
+    for week in weeks:
+        record_cache_lookup(week not in missing)
+    if missing:
+        loaded = load_rosters(missing, project)
+        cache.set_many({keys[week]: roster for week, roster in loaded.items()})
+        rosters.update(loaded)
+    return rosters
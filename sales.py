@@ -0,0 +1,98 @@
+"""Saisie groupée des ventes et des stocks d'un laboratoire."""
+from datetime import date
+
+from sqlalchemy import insert, update
+
+from models import db, Product, Sale
+from revenue import LABS, record_sales
+from stock import STOCK_COLUMNS, locked_products, record_movements, stock_movements
+
+
+class SalesFormError(ValueError):
+    """Formulaire de ventes invalide ; args[0] contient la liste des erreurs."""
+
+
+def _parse_number(value, cast, label, errors):
+    if value is None or value.strip() == '':
+        return None
+    try:
+        number = cast(value)
+    except ValueError:
+        errors.append(f'{label} : valeur invalide « {value} ».')
+        return None
+    if number < 0:
+        errors.append(f'{label} : la valeur ne peut pas être négative.')
+        return None
+    return number
+
+
+def parse_sales_form(form, products, commercial_id, lab):
+    """Valide tout le formulaire avant toute écriture.
+
+    Renvoie (date, lignes de ventes, lignes de stocks modifiés), les lignes de ventes étant
+    prêtes pour un executemany et celles de stocks limitées aux niveaux saisis.
+    Lève SalesFormError si une valeur est invalide.
+    """
+    errors = []
+    try:
+        sale_date = date.fromisoformat(form.get('sale_date') or '')
+    except ValueError:
+        raise SalesFormError(['Veuillez saisir une date.'])
+
+    sales, stocks = [], []
+    for product in products:
+        quantity = _parse_number(form.get(f'quantity_{product.id}'), int, product.name, errors)
+        if quantity:
+            raw_price = form.get(f'price_{product.id}')
+            price = _parse_number(raw_price, float, f'{product.name} (prix)', errors)
+            if not (raw_price or '').strip():
+                errors.append(f'{product.name} : prix manquant.')
+            elif price is not None:
+                sales.append({
+                    'lab': lab.key,
+                    'product_id': product.id,
+                    'quantity': quantity,
+                    'price': price,
+                    'date': sale_date,
+                    'commercial_id': commercial_id,
+                    'project': lab.project,
+                })
+
+        # Seuls les stocks réellement modifiés sont mis à jour
+        stock = {}
+        for column in STOCK_COLUMNS:
+            level = _parse_number(form.get(f'{column}_{product.id}'), int, f'{product.name} ({column})', errors)
+            if level is not None and level != getattr(product, column):
+                stock[column] = level
+        if stock:
+            stocks.append({'id': product.id, **stock})
+
+    if errors:
+        raise SalesFormError(errors)
+    return sale_date, sales, stocks
+
+
+def save_sales_entry(lab_key, form, products, commercial_id):
+    """Enregistre ventes, agrégat mensuel, stocks et mouvements de stock d'un formulaire, dans une seule transaction.
+
+    Renvoie le nombre de ventes insérées.
+    """
+    lab = LABS[lab_key]
+    sale_date, sales, stocks = parse_sales_form(form, products, commercial_id, lab)
+    try:
+        if sales:
+            db.session.execute(insert(Sale), sales)
+            record_sales(lab_key, sales)
+        if stocks:
+            # Niveaux relus sous verrou : les deltas et les colonnes non saisies partent de l'état courant
+            current = {product.id: product for product in locked_products([stock['id'] for stock in stocks])}
+            record_movements(stock_movements(lab_key, current.values(), stocks, sale_date, 'saisie_ventes'))
+            db.session.execute(update(Product), [
+                {'id': stock['id'], **{column: stock.get(column, getattr(current[stock['id']], column)) for column in STOCK_COLUMNS}}
+                for stock in stocks
+            ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(sales)
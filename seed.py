@@ -0,0 +1,283 @@
+"""Données initiales (utilisateurs et produits), insérées par la commande `flask seed`.
+
+L'insertion est idempotente et ensembliste : un SELECT des noms existants,
+puis un INSERT groupé des lignes manquantes. Les mots de passe des seuls
+utilisateurs manquants sont hachés en parallèle dans un pool de processus.
+
+Pour les jeux de test, SEED_PASSWORD_METHOD (par exemple
+"pbkdf2:sha256:1000") remplace la méthode de hachage par défaut, bien plus
+coûteuse.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from sqlalchemy import insert, select, tuple_
+from werkzeug.security import generate_password_hash
+
+from models import db, Product, User
+
+# (nom, mot de passe, rôle, zone, projet)
+ADMINS = [
+    ("Anna Diallo", "admin123", "admin", None, 'nasmedic'),
+]
+
+# (nom, mot de passe, zone, projet)
+COMMERCIAUX_NASMEDIC = [
+    ("KHALIFA DIOP", "khalifa123", "CENTRE VILLE", 'nasmedic'),
+    ("AMADOU DEME", "amadou123", "Banlieue 1", 'nasmedic'),
+    ("MBAYE NDOYE", "mbaye123", "THIES", 'nasmedic'),
+    ("MEDINA K NDIAYE", "medina123", "ZONES INTERMEDIAIRE 2", 'nasmedic'),
+    ("MARIE LOUISE", "marie123", "MBOUR", 'nasmedic'),
+    ("FATOU COLLETTE DRAME", "fatou123", "ZONES INTERMEDIAIRE 1", 'nasmedic'),
+    ("MASSAMBA MBAYE", "massamba123", "Banlieue 2", 'nasmedic'),
+    ("LAMINE THIOUB", "lamine123", "REGION DE DIOURBEL", 'nasmedic'),
+]
+
+COMMERCIAUX_NASDERM = [
+    ("FAMA DIOP", "fama123", "CENTRE VILLE", 'nasderm'),
+    ("MARIE JEANNE DIOUF", "marie123", "Banlieue 1", 'nasderm'),
+    ("ASTOU MANA MBENGUE", "astou123", "THIES", 'nasderm'),
+    ("HONORINE", "honorine123", "ZONES INTERMEDIAIRE 2", 'nasderm'),
+    ("MIJO", "mijo123", "MBOUR", 'nasderm'),
+    ("HELENE FAYE", "helene123", "ZONES INTERMEDIAIRE 1", 'nasderm'),
+    ("ADJARA CISSÉ", "adjara123", "Banlieue 2", 'nasderm'),
+    ("KHAR FALL", "khar123", "REGION DE DIOURBEL", 'nasderm'),
+    ("KHADY SOW", "khady123", "REGION DE DIOURBEL", 'nasderm'),
+]
+
+# (nom, prix par défaut) par laboratoire
+NOVA_PHARMA_PRODUCTS = [
+    ("HYFAC GEL NETTOYANT FLC 150ML", 3.5),
+    ("HYFAC GEL NETTOYANT TB 300ML", 3.5),
+    ("HYFAC PAIN NETTOYANT 100G SOUS ETUI", 3.5),
+    ("HYFAC MOUSSE NETTOYANTE FLC150ML", 3.5),
+    ("HYFAC SOIN GLOBAL FLC40ML/ETUI", 3.5),
+    ("HYFAC ETUI 2X15 PATCHS IMPERFECTIONS", 3.5),
+    ("HYFAC MOUSSE A RASER SENSITIVE FLC150ML", 3.5),
+    ("HYFAC SUN SPF 50+ INV TB 40ML SS ETUI", 3.5),
+    ("CLARIFAC Soin anti-taches 40ML", 3.5),
+    ("HYFAC WOMAN SOIN GLOBAL TB 40ML/ETUI", 3.5),
+    ("HYFAC WOMAN LOTION VISAGE FL 200 ML", 3.5),
+    ("HYFAC WOMAN ACTIVE MASK 15*5ML", 3.5),
+    ("HYDRAFAC CREME HYDRA LEGERE TUBE40 ML", 3.5),
+]
+
+GILBERT_PRODUCTS = [
+    ("ELLE TEST BTE DE 1 TEST GROSSESSE", 3.5),
+    ("MOUSTIDOSE SPRAY REPULSIF ZONE INFESTEES IR3535 +12M  100ML", 3.5),
+    ("MOUSTIDOSE SPRAY REPULSIF ACTIF VÉGÉTAL +6M 100ML", 3.5),
+    ("MOUSTIDOSE SPRAY REPULSIF ZONE TRES INFESTEES ICARIDINE  +24M 100ML", 3.5),
+    ("MOUSTIDOSE CREME SOIN CALMANT  40ML", 3.5),
+    ("WATERWIPES LINGETTES BD BB 4X60", 3.5),
+    ("WATERWIPES LINGETTES BD BB X60", 3.5),
+    ("WATERWIPES LINGETTES BD BB X28", 3.5),
+    ("LEL SUCE NOUVEAU NE SYM ROSE PANACH 2X3", 3.5),
+    ("LEL SUCE NOUVEAU NE SYM BLEU PANACHE 2X3", 3.5),
+    ("LEL SUCE NOUVEAU NE SYM JAUNE", 3.5),
+    ("LEL DUO SUCE ANA 0-6M LAPIN + CŒUR", 3.5),
+    ("LEL DUO SUCE ANA 0-6M RENARD + CŒUR", 3.5),
+    ("LEL SUCE 0-6M ANA MAMAN ANNEAU", 3.5),
+    ("LEL SUCE 0-6M ANA PAPA ANNEAU", 3.5),
+    ("LEL SUCE NUIT 0-6M ANA ELEPH BLEU ANNEAU", 3.5),
+    ("LEL SUCE NUIT  0-6M ANA ELEPH ROSE ANNEAU", 3.5),
+    ("SUCETTE 0-6 MOIS PHYSIOLOGIQUE (BÉBÉ ALLAITÉ) ELEPHANT", 3.5),
+    ("LEL SUCE 0-6M PHYS BB AMOUR ANNEAU", 3.5),
+    ("LEL SUCE 6-18M ANA BEBE AMOUR ANNEAU", 3.5),
+    ("LEL SUCE 6-18M ANA MAMAN ANNEAU", 3.5),
+    ("LEL SUCE 6-18M ANA PAPA ANNEAU", 3.5),
+    ("LEL SUCE 6-18M PHYS DIS MOI  ANNEAU", 3.5),
+    ("LEL SUCE +18M ANA JAIME PARENTS ANNEAU", 3.5),
+    ("LEL BIBERON PLASTIQUE 150ML SAVANE PP", 3.5),
+    ("LEL BIBERON ERGOSENSE 270ML SAVANE PP", 3.5),
+    ("LEL BIBERON PLASTIQUE 330ML SAVANE PP", 3.5),
+    ("LEL BIBERON VERRE 120ML", 3.5),
+    ("LEL BIBERON VERRE 240ML", 3.5),
+    ("LEL TETINE ERGOSENSE SIL. DEB. LENT (X2)", 3.5),
+    ("LEL TETINE ERGOSENSE SIL. DEB. MOY (X2)", 3.5),
+    ("LEL TETINE ERGOSENSE SIL.DEB.VAR (X2)", 3.5),
+    ("LEL TETINE ERGOSENSE DEB. LIQ.EPAIS (X2)", 3.5),
+    ("LEL ATTACHE SUCETTE 2023", 3.5),
+    ("LEL ANNEAU DENTITION FORME HOCHET", 3.5),
+    ("LEL COUPE ONGLES BEBE", 3.5),
+    ("LEL CISEAUX DROITS", 3.5),
+    ("LEL 60 BATONNETS EMBOUT BEBE", 3.5),
+    ("LEL GOUPILLON", 3.5),
+    ("NEUTRADERM BAUME RELIPIDANT 400ML RELIPID +", 3.5),
+    ("NEUTRADERM BAUME RELIPIDANT 200ML RELIPID +", 3.5),
+    ("NEUTRADERM HUILE LAVANTE RELIPIDANTE 400ML RELIPID +", 3.5),
+    ("NEUTRADERM HUILE LAVANTE RELIPIDANTE 1L RELIPID +", 3.5),
+    ("NEUTRADERM CREME DE DOUCHE RELIPIDANTE 400ML RELIPID +", 3.5),
+    ("NEUTRADERM CREME DE DOUCHE RELIPIDANTE 200ML RELIPID +", 3.5),
+    ("NEUTRADERM GEL DOUCHE SURGRAS DERMO-PROTECTEUR TB 200ML", 3.5),
+    ("NEUTRADERM GEL DOUCHE SURGRAS DERMO-PROTECTEUR 500ML", 3.5),
+    ("NEUTRADERM GEL DOUCHE SURGRAS DERMO-PROTECTEUR 1 LITRE", 3.5),
+    ("NEUTRADERM SAVON SURGRAS DERMO-PROTECTEUR 200G", 3.5),
+    ("NEUTRADERM GEL CREME NOURISSANT DERMO-PROTECTEUR TB 200ML", 3.5),
+    ("NEUTRADERM GEL CREME NOURISSANT DERMO-PROTECTEUR 400ML", 3.5),
+    ("NEUTRADERM GEL DOUCHE MICELLAIRE DERMO-APAISANT 1L", 3.5),
+    ("NEUTRADERM GEL CREME HYDRATANT DERMO-APAISANT TB 200ML", 3.5),
+    ("NEUTRADERM GEL CREME HYDRATANT DERMO-APAISANT 400ML", 3.5),
+    ("NEUTRADERM BABY GEL NETTOYANT DOUCEUR 3 EN 1 TB 200ML", 3.5),
+    ("NEUTRADERM BABY GEL NETTOYANT DOUCEUR 3 EN 1 FL. POMPE 400ML", 3.5),
+    ("NEUTRADERM BABY EAU NETTOYANTE DOUCEUR 3 EN 1 FL. CAPS. 200ML", 3.5),
+    ("NEUTRADERM BABY EAU NETTOYANTE DOUCEUR 3 EN 1 FL. POMPE 1L", 3.5),
+    ("NEUTRADERM BABY CREME HYDRATANTE APAISANTE TB AVEC ETUI 100ML", 3.5),
+    ("NEUTRADERM SOIN LAVANT DOUCEUR INTIME FL250ML", 3.5),
+    ("NEUTRADERM SOIN LAVANT DOUCEUR INTIME FL500ML", 3.5),
+    ("NEUTRADERM CRÈME APAISANTE DOUCEUR INTIME 40ML", 3.5),
+    ("NEUTRADERM BRUME D'EAU, SOIN APAISANT 150ML", 3.5),
+    ("NEUTRADERM BRUME D'EAU, SOIN APAISANT 300ML", 3.5),
+    ("LAINO GEL CREME  HYDRATANTE ANTI OXYDANT 40ML REPACK", 3.5),
+    ("LAINO CREME NOURRISSANTE ANTI OXYDANT 40ML REPACK", 3.5),
+    ("LAINO SERUM HYDRATANT ANTI OXYDANT 30ML REPACK", 3.5),
+    ("LAINO CONTOUR DES YEUX HYDRATANT 15ML REPACK", 3.5),
+    ("LAINO GEL NETTOYANT DEMAQUILLANT 200ML REPACK", 3.5),
+    ("LAINO GOMMAGE HYDRATANT TB75ML", 3.5),
+    ("LAINO MASQUE HYDRATANT TB75ML", 3.5),
+    ("LAINO LAIT HYDRATANT AMANDE DOUCE FL400ML", 3.5),
+    ("LAINO SOIN NUTRITIF INTENSE OLIVE FLC400ML", 3.5),
+    ("LAINO LAIT NUTRI CONFORT KARITE FLC400ML", 3.5),
+    ("LAINO LAIT NUTRI BIEN ETRE ROSE  FL400ML", 3.5),
+    ("LAINO LAIT NUTRI FERMETE ARGAN FLC400ML", 3.5),
+    ("LAINO SAVON SOUFRE  SOUS ETUI 150G", 3.5),
+    ("LAINO SOIN LEVRE PRO INTENSE STICK 4G", 3.5),
+    ("LAINO SOIN LEVRES FIGUE 4G huiles végétales", 3.5),
+    ("LAI SOIN DES LEVRES FRAISE 4G", 3.5),
+    ("LAI SOIN DES LEVRES VANILLE 4G", 3.5),
+    ("LAI SOIN DES LEVRES GRENADINE 4G", 3.5),
+    ("LAI SOIN DES LEVRES COCO 4G", 3.5),
+    ("LAI SOIN DES LEVRES FRAMBOISE 4G", 3.5),
+    ("LAI SOIN DES LEVRES CERISE 4G", 3.5),
+    ("LAI SOIN DES LEVRES POMME 4G", 3.5),
+    ("LAI SOIN DES LEVRES CASSIS 4G", 3.5),
+    ("LAINO CREME MAIN PRO INTENSE TB50ML", 3.5),
+    ("LAINO SAVON SOLIDE D'ALEP ETUI150GR", 3.5),
+    ("LAINO SAVON LIQ MARSEILLE FLC300ML", 3.5),
+    ("LAINO L'AUTHENTIQUE SAVON MARSEILLE 150G", 3.5),
+    ("LAINO PATE ARGILE VERTE TB350G", 3.5),
+    ("LAINO ARGILE POUDRE SURFINE ETUI300G", 3.5),
+    ("LAINO EAU DE ROSE FLC250ML", 3.5),
+    ("LAINO EAU FLORALE DE BLEUET FLC250ML", 3.5),
+    ("LAINO EAU DE FLEUR D'ORANGER FLC250ML", 3.5),
+]
+
+ERIC_FAVRE_PRODUCTS = [
+    ("Chronoerect", 3.58),
+    ("Special Kid calcium", 2.65),
+    ("Special Kid Fer", 2.65),
+    ("Special kid immunite", 3.00),
+    ("Special Kid multivit", 2.65),
+    ("Special Kid nez et gorge", 2.65),
+    ("Special kid nutri+", 2.65),
+    ("Special kid probiotiques", 8.56),
+    ("Special kid rehydratation", 2.65),
+    ("Special kid sol spray nasal F/50ML", 2.65),
+    ("Special Kid sommeil", 2.65),
+    ("Special kid Soulage doux", 2.65),
+    ("Special kid Zinc", 2.65),
+    ("Time Sex Control", 6.90),
+    ("Appetit Plus", 2.34),
+]
+
+TROIS_CHENE_PRODUCTS = [
+    ("ASTHE 1000", 6.05),
+    ("BOIS BANDE", 3.45),
+    ("CARBOLINE CPR B/30", 2.40),
+    ("DIARILIUM ENFANT SOL BUV", 1.95),
+    ("DIARILIUM SOL BV UNICADOSE", 2.64),
+    ("DYSMECALM CPR B/15", 2.90),
+    ("EASY MOM GROSSESSE GEL B/30", 3.70),
+    ("EFIRUB CPR B/30", 3.50),
+    ("EFIRUB PDRE SOL BUV SACH B/8", 3.45),
+    ("FLATUPLEXIN", 4.80),
+    ("MYOCALM", 3.55),
+    ("OSTEOPHYTUM CP", 7.50),
+    ("OSTEOPHYTUM GEL 100ML", 4.75),
+    ("OSTEOPHYTUM PATCH/14", 2.55),
+    ("SEDABUCCIL", 3.60),
+    ("SOMNIPLEX MELATONINE CPR", 5.20),
+    ("VAGALINE SPRAY BUCCAL F/25ML", 3.75),
+    ("VAGALINE CPR B/15", 2.45),
+    ("SPRAY NASAL", 3.75),
+    ("MYOCALM ROLL ON 50ML", 4.20),
+    ("MYOCALM SPRAY 100ML", 4.25),
+    ("INFLAKIN/30", 8.95),
+    ("INFLAKIN/10", 5.15),
+]
+
+PRODUCTS = {
+    'nova_pharma': NOVA_PHARMA_PRODUCTS,
+    'gilbert': GILBERT_PRODUCTS,
+    'eric_favre': ERIC_FAVRE_PRODUCTS,
+    'trois_chene': TROIS_CHENE_PRODUCTS,
+}
+
+
+def _initial_users():
+    users = list(ADMINS)
+    for username, password, zone, project in COMMERCIAUX_NASMEDIC + COMMERCIAUX_NASDERM:
+        users.append((username, password, 'commercial', zone, project))
+    return users
+
+
+def _hash_password(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _hash_passwords(passwords, workers=None, method=None):
+    """Hache les mots de passe, en parallèle dès qu'il y en a plusieurs."""
+    hash_password = partial(_hash_password, method=method or os.environ.get('SEED_PASSWORD_METHOD', 'pbkdf2:sha256'))
+    if len(passwords) < 2 or workers == 1:
+        return [hash_password(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_password, passwords))
+
+
+def seed_users(workers=None, password_method=None):
+    """Insère les utilisateurs initiaux manquants. Renvoie le nombre d'insertions."""
+    users = _initial_users()
+    existing = set(db.session.scalars(
+        select(User.username).where(User.username.in_([user[0] for user in users]))
+    ))
+    missing = [user for user in users if user[0] not in existing]
+    if not missing:
+        return 0
+
+    hashes = _hash_passwords([user[1] for user in missing], workers, password_method)
+    db.session.execute(insert(User), [
+        {'username': username, 'password': password_hash, 'role': role, 'zone': zone, 'project': project}
+        for (username, _password, role, zone, project), password_hash in zip(missing, hashes)
+    ])
+    return len(missing)
+
+
+def seed_products():
+    """Insère les produits initiaux manquants. Renvoie le nombre d'insertions."""
+    # Un produit cité deux fois dans une liste n'est inséré qu'une fois
+    products = {}
+    for lab, items in PRODUCTS.items():
+        for name, price in items:
+            products.setdefault((lab, name), price)
+
+    existing = set(db.session.execute(
+        select(Product.lab, Product.name).where(tuple_(Product.lab, Product.name).in_(list(products)))
+    ).tuples())
+    missing = [
+        {'lab': lab, 'name': name, 'default_price': price}
+        for (lab, name), price in products.items() if (lab, name) not in existing
+    ]
+    if missing:
+        db.session.execute(insert(Product), missing)
+    return len(missing)
+
+
+def seed(workers=None, password_method=None):
+    """Utilisateurs et produits initiaux, dans une seule transaction."""
+    try:
+        counts = seed_users(workers, password_method), seed_products()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return counts
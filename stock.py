@@ -0,0 +1,144 @@
+"""Journal des mouvements de stock par produit et distributeur, avec instantané compacté.
+
+Chaque modification de stock ajoute des lignes (delta) à stock_movement. La
+table stock_snapshot cumule le journal jusqu'à un mouvement donné : le stock
+courant vaut l'instantané plus les quelques mouvements postérieurs, et les
+questions sur une période se résolvent par un parcours d'index sur (lab, date).
+"""
+from datetime import datetime
+
+from sqlalchemy import func, insert, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Product, StockMovement, StockSnapshot
+from periods import in_range
+
+DISTRIBUTORS = ['duopharm', 'ubipharm', 'laborex', 'sodipharm']
+STOCK_COLUMNS = [f'stock_{distributor}' for distributor in DISTRIBUTORS]
+
+
+def locked_products(product_ids):
+    """Produits relus dans la transaction en cours et verrouillés jusqu'à sa fin (FOR UPDATE).
+
+    Les niveaux chargés avant la saisie peuvent avoir été modifiés entre-temps par
+    une autre saisie : les deltas du journal se calculent sur ces lignes relues.
+    """
+    return Product.query.filter(Product.id.in_(product_ids)).with_for_update().populate_existing().all()
+
+
+def stock_movements(lab_key, products, stocks, movement_date, source):
+    """Mouvements correspondant au passage des stocks des produits aux niveaux saisis.
+
+    stocks est une liste de dictionnaires {'id': ..., 'stock_<distributeur>': niveau}, limités
+    aux distributeurs saisis ; products doit venir de locked_products.
+    """
+    products_by_id = {product.id: product for product in products}
+    movements = []
+    for stock in stocks:
+        product = products_by_id[stock['id']]
+        for distributor, column in zip(DISTRIBUTORS, STOCK_COLUMNS):
+            if column not in stock:
+                continue
+            delta = stock[column] - getattr(product, column)
+            if delta:
+                movements.append({
+                    'lab': lab_key,
+                    'product_id': product.id,
+                    'distributor': distributor,
+                    'delta': delta,
+                    'date': movement_date,
+                    'source': source,
+                })
+    return movements
+
+
+def record_movements(movements):
+    """Ajoute les mouvements au journal, dans la transaction en cours."""
+    if movements:
+        db.session.execute(insert(StockMovement), movements)
+
+
+def _watermark():
+    return db.session.query(func.coalesce(func.max(StockSnapshot.last_movement_id), 0)).scalar()
+
+
+def _sum_deltas(lab_key, *conditions):
+    return db.session.query(
+        StockMovement.product_id, StockMovement.distributor, func.sum(StockMovement.delta)
+    ).filter(StockMovement.lab == lab_key, *conditions).group_by(
+        StockMovement.product_id, StockMovement.distributor
+    ).all()
+
+
+def current_stock(lab_key):
+    """{(product_id, distributeur): quantité} : instantané + mouvements non encore compactés."""
+    watermark = _watermark()
+    stock = {
+        (row.product_id, row.distributor): row.quantity
+        for row in StockSnapshot.query.filter_by(lab=lab_key)
+    }
+    for product_id, distributor, delta in _sum_deltas(lab_key, StockMovement.id > watermark):
+        stock[(product_id, distributor)] = stock.get((product_id, distributor), 0) + delta
+    return stock
+
+
+def stock_at(lab_key, at_date):
+    """Stock à la fin du jour at_date : stock courant moins les mouvements datés après."""
+    stock = current_stock(lab_key)
+    for product_id, distributor, delta in _sum_deltas(lab_key, StockMovement.date > at_date):
+        stock[(product_id, distributor)] = stock.get((product_id, distributor), 0) - delta
+    return stock
+
+
+def movement_totals(lab_key, start, end):
+    """Mouvement net par distributeur sur [start, end[ : {distributeur: delta}."""
+    rows = db.session.query(StockMovement.distributor, func.sum(StockMovement.delta)).filter(
+        StockMovement.lab == lab_key, in_range(StockMovement.date, start, end)
+    ).group_by(StockMovement.distributor).all()
+    return dict(rows)
+
+
+def compact_stock_ledger():
+    """Reporte les mouvements postérieurs à l'instantané dans stock_snapshot.
+
+    Le journal n'est jamais modifié. Renvoie le nombre de mouvements compactés.
+
+    Le compactage s'arrête au plus grand id présent : aucun mouvement d'id
+    inférieur ne doit pouvoir être validé ensuite, sans quoi il serait ignoré
+    pour toujours. Sur PostgreSQL, les ids sont attribués à l'insertion et non
+    au commit : le verrou SHARE ROW EXCLUSIVE attend la fin des transactions
+    qui écrivent dans le journal et bloque les nouvelles (ainsi qu'un second
+    compactage) jusqu'au commit ; les lectures ne sont pas bloquées. SQLite
+    n'admet qu'un écrivain à la fois : les ids y sont validés dans l'ordre.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        db.session.execute(text('LOCK TABLE stock_movement IN SHARE ROW EXCLUSIVE MODE'))
+    watermark = _watermark()
+    last_id = db.session.query(func.max(StockMovement.id)).scalar() or 0
+    if last_id <= watermark:
+        db.session.commit()
+        return 0
+
+    rows = db.session.query(
+        StockMovement.lab, StockMovement.product_id, StockMovement.distributor,
+        func.sum(StockMovement.delta), func.count()
+    ).filter(StockMovement.id > watermark, StockMovement.id <= last_id).group_by(
+        StockMovement.lab, StockMovement.product_id, StockMovement.distributor
+    ).all()
+
+    now = datetime.utcnow()
+    insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    stmt = insert_(StockSnapshot).values([
+        {'lab': lab, 'product_id': product_id, 'distributor': distributor,
+         'quantity': delta, 'last_movement_id': last_id, 'updated_at': now}
+        for lab, product_id, distributor, delta, _count in rows
+    ])
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['lab', 'product_id', 'distributor'],
+        set_={'quantity': StockSnapshot.quantity + stmt.excluded.quantity, 'updated_at': now}
+    ))
+    # Toutes les lignes de l'instantané couvrent désormais le journal jusqu'à last_id
+    db.session.execute(update(StockSnapshot).values(last_movement_id=last_id))
+    db.session.commit()
+    return sum(count for *_key, count in rows)
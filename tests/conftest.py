@@ -0,0 +1,100 @@
+"""Application de test sur une base SQLite temporaire, remplie d'un petit jeu de données."""
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Lus à l'import de app.py : base jetable, et pas de cache de requêtes pour des comptes stables
+_DB_DIR = tempfile.mkdtemp(prefix='crm_tests_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_DB_DIR, 'test.db')
+os.environ['CACHE_TYPE'] = 'NullCache'
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app as flask_app  # noqa: E402
+from models import db, Planning, Prospection, User  # noqa: E402
+
+PASSWORD = 'secret'
+ADMIN = 'Admin Test'
+COMMERCIAUX = [('AMINATA NDIAYE', 'nasmedic', 12), ('MOUSSA FALL', 'nasmedic', 3), ('KHADY SOW', 'nasderm', 0)]
+PLANNINGS_PER_COMMERCIAL = 3
+
+# Le dossier des gabarits s'appelle Templates : sur un système de fichiers sensible à la casse,
+# Flask ne le trouve pas sous le nom par défaut
+if not os.path.isdir(os.path.join(ROOT, 'templates')):
+    flask_app.template_folder = 'Templates'
+
+
+def _seed():
+    password = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    db.session.add(User(username=ADMIN, password=password, role='admin', project='nasmedic'))
+    for username, project, prospections in COMMERCIAUX:
+        commercial = User(username=username, password=password, role='commercial', zone='CENTRE VILLE',
+                          project=project)
+        db.session.add(commercial)
+        db.session.flush()
+        for n in range(prospections):
+            db.session.add(Prospection(
+                commercial_id=commercial.id, date=date(2025, 1, 1) + timedelta(days=n), nom_client=f'Client {n}',
+                specialite='GENERALISTE', structure='HOPITAL', telephone='770000000',
+            ))
+        for week in range(PLANNINGS_PER_COMMERCIAL):
+            db.session.add(Planning(commercial_id=commercial.id, date=date(2025, 1, 6) + timedelta(weeks=week),
+                                    lundi_matin='HOPITAL', mardi_soir='CLINIQUE, PHARMACIES'))
+    db.session.commit()
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        db.create_all()
+        _seed()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    def login(username):
+        response = client.post('/login', data={'username': username, 'password': PASSWORD})
+        assert response.status_code == 302
+        return client
+    return login
+
+
+@pytest.fixture
+def count_queries(app):
+    """Contexte qui relève les requêtes SQL exécutées : with count_queries() as statements: ..."""
+    @contextmanager
+    def count_queries():
+        statements = []
+
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', _record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', _record)
+    return count_queries
@@ -0,0 +1,64 @@
+"""Nombre de requêtes SQL des pages de liste (voir projections.py).
+
+Chaque page exécute un nombre fixe de requêtes, quel que soit le nombre de
+prospections ou de plannings affichés : aucun chargement paresseux par ligne.
+"""
+from urllib.parse import quote
+
+import pytest
+
+from conftest import ADMIN, COMMERCIAUX
+from models import User
+
+USERNAMES = [username for username, _project, _prospections in COMMERCIAUX]
+
+
+def _page_queries(client, count_queries, url):
+    # Premier appel : l'utilisateur de session entre dans le cache (auth.py) et n'est plus relu
+    assert client.get(url).status_code == 200
+    with count_queries() as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def _commercial_id(app, username):
+    with app.app_context():
+        return User.query.filter_by(username=username).one().id
+
+
+@pytest.mark.parametrize('username', USERNAMES)
+def test_commercial_dashboard(login, count_queries, username):
+    # Le commercial, puis ses prospections
+    client = login(ADMIN)
+    assert _page_queries(client, count_queries, f'/commercial_dashboard/{quote(username)}') == 2
+
+
+def test_admin_plannings(login, count_queries):
+    client = login(ADMIN)
+    assert _page_queries(client, count_queries, '/admin_plannings') == 1
+
+
+@pytest.mark.parametrize('username', USERNAMES)
+def test_admin_planning_detail(app, login, count_queries, username):
+    # Le commercial, puis ses plannings
+    client = login(ADMIN)
+    url = f'/admin_planning_detail/{_commercial_id(app, username)}'
+    assert _page_queries(client, count_queries, url) == 2
+
+
+def test_visualiser_planning(login, count_queries):
+    client = login(USERNAMES[0])
+    assert _page_queries(client, count_queries, '/visualiser_planning') == 1
+
+
+@pytest.mark.parametrize('url, expected', [
+    # Filtres de l'export seulement ; les graphiques sont chargés par /api/charts
+    ('/admin_dashboard', 0),
+    # Page de prospections, liste des commerciaux, trois facettes (spécialités, structures, zones)
+    ('/nasmedic_dashboard', 5),
+    ('/nasderm_dashboard', 5),
+])
+def test_listing_dashboards(login, count_queries, url, expected):
+    client = login(ADMIN)
+    assert _page_queries(client, count_queries, url) == expected